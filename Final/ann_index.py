@@ -0,0 +1,122 @@
+# Script containing an approximate nearest neighbour index for 'helper_functions.py', which partitions players into
+# clusters of similar raw traits so that a query only scores the players in its most similar clusters.
+
+# import packages
+import numpy as np
+
+# constants
+KMEANS_ITERATIONS = 20
+KMEANS_SAMPLE_SIZE = 50000
+CALIBRATION_SAMPLE_SIZE = 200
+CALIBRATION_TOP_N = 20
+BLOCK_SIZE = 4096
+SEED = 0
+
+def normalise_rows(matrix):
+
+    # scale rows to unit length, leaving rows full of zeros as they are
+    lengths = np.linalg.norm(matrix, axis=1, keepdims=True)
+    lengths[lengths == 0] = 1
+
+    return matrix / lengths
+
+def weighted_cosine_scores(vec, matrix, weights):
+
+    # weighted cosine similarity of vec to each row, used to rank clusters and candidates
+    vec = np.asarray(vec, dtype=float)
+    weighted_matrix = matrix * weights
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = (weighted_matrix @ vec) / (np.sqrt(np.einsum('ij,ij->i', weighted_matrix, matrix)) * np.sqrt((vec ** 2) @ weights))
+
+    return np.nan_to_num(scores, nan=0)
+
+class IVFIndex:
+
+    def __init__(self, matrix, num_clusters=None, seed=SEED):
+
+        self.matrix = matrix
+        rng = np.random.default_rng(seed)
+
+        # about sqrt(n) clusters of normalised raw traits
+        if num_clusters is None:
+            num_clusters = int(np.sqrt(matrix.shape[0]))
+        num_clusters = max(1, min(num_clusters, matrix.shape[0]))
+        normalised_matrix = normalise_rows(matrix)
+
+        # spherical k-means on a sample of rows
+        sample = normalised_matrix[rng.choice(matrix.shape[0], size=min(KMEANS_SAMPLE_SIZE, matrix.shape[0]), replace=False)]
+        self.centroids = sample[rng.choice(sample.shape[0], size=num_clusters, replace=False)]
+        for _ in range(KMEANS_ITERATIONS):
+            assignments = np.argmax(sample @ self.centroids.T, axis=1)
+            sums = np.zeros_like(self.centroids)
+            np.add.at(sums, assignments, sample)
+            empty = ~sums.any(axis=1)
+            sums[empty] = self.centroids[empty]
+            self.centroids = normalise_rows(sums)
+
+        # assign all rows in blocks and store members of each cluster contiguously
+        assignments = np.concatenate([np.argmax(normalised_matrix[start:start + BLOCK_SIZE] @ self.centroids.T, axis=1)
+                                      for start in range(0, matrix.shape[0], BLOCK_SIZE)])
+        self.cluster_rows = np.argsort(assignments, kind='stable').astype(np.int64)
+        self.cluster_offsets = np.searchsorted(assignments[self.cluster_rows], np.arange(num_clusters + 1))
+
+        self.num_probes = num_clusters
+
+    def cluster_members(self, clusters):
+
+        return np.concatenate([self.cluster_rows[self.cluster_offsets[cluster]:self.cluster_offsets[cluster + 1]]
+                               for cluster in clusters]) if len(clusters) > 0 else np.zeros(0, dtype=np.int64)
+
+    def search(self, vec, weights=None, keep_mask=None, top_n=CALIBRATION_TOP_N, num_probes=None):
+
+        if weights is None:
+            weights = np.ones(len(vec))
+        if num_probes is None:
+            num_probes = self.num_probes
+
+        # rank clusters by similarity of their centroid to the query
+        cluster_order = np.argsort(-weighted_cosine_scores(vec, self.centroids, np.asarray(weights, dtype=float)), kind='stable')
+
+        # probe clusters until enough are probed and enough of their members are kept by filters
+        num_probed = 0
+        num_kept = 0
+        while num_probed < len(cluster_order) and (num_probed < num_probes or num_kept < top_n):
+            cluster = cluster_order[num_probed]
+            members = self.cluster_rows[self.cluster_offsets[cluster]:self.cluster_offsets[cluster + 1]]
+            num_kept += len(members) if keep_mask is None else int(keep_mask[members].sum())
+            num_probed += 1
+        candidate_rows = self.cluster_members(cluster_order[:num_probed])
+
+        # members of the least similar clusters, used to estimate the minimum score for normalisation
+        min_rows = self.cluster_members(cluster_order[max(num_probed, len(cluster_order) - num_probes):])
+
+        return candidate_rows, min_rows
+
+    def calibrate(self, recall_target, sample_size=CALIBRATION_SAMPLE_SIZE, top_n=CALIBRATION_TOP_N, seed=SEED):
+
+        rng = np.random.default_rng(seed)
+        queries = rng.choice(self.matrix.shape[0], size=min(sample_size, self.matrix.shape[0]), replace=False)
+        top_n = min(top_n, self.matrix.shape[0] - 1)
+
+        # exact top n of each query under default weights, excluding the query itself
+        weights = np.ones(self.matrix.shape[1])
+        exact_top_n = []
+        for query in queries:
+            scores = weighted_cosine_scores(self.matrix[query], self.matrix, weights)
+            scores[query] = -np.inf
+            exact_top_n.append(set(np.argpartition(scores, -top_n)[-top_n:]))
+
+        # smallest number of probes whose mean recall reaches the target
+        for num_probes in range(1, len(self.centroids) + 1):
+            recalls = []
+            for query, exact in zip(queries, exact_top_n):
+                candidate_rows, _ = self.search(self.matrix[query], top_n=0, num_probes=num_probes)
+                recalls.append(len(exact.intersection(candidate_rows)) / top_n)
+            if np.mean(recalls) >= recall_target:
+                break
+        self.num_probes = num_probes
+
+        return num_probes, float(np.mean(recalls))
+
+if __name__ == '__main__':
+    print('This file should not be called directly!')
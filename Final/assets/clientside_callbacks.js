@@ -0,0 +1,66 @@
+// Clientside callbacks of 'launch_dashboard.py', which update the player inputs and render results without a request to the server.
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    clientside: {
+
+        // prevents player 2 to come back when player 1 is input again
+        update_player_2: function(player_1_details) {
+            if (player_1_details === null || player_1_details === undefined) {
+                return null;
+            }
+            return window.dash_clientside.no_update;
+        },
+
+        // updates dropdown list of weights when both players 1 and 2 are input
+        update_players_weight_dropdowns: function(player_1_details, player_2_details) {
+            if (player_1_details === null || player_1_details === undefined) {
+                return [[], 'Weightage', [], 'Weightage'];
+            }
+            if (player_2_details === null || player_2_details === undefined) {
+                return [[], '100%', [], ''];
+            }
+            const options = [];
+            for (let i = 10; i <= 90; i += 10) {
+                options.push(`${i}%`);
+            }
+            return [options, '50%', options, '50%'];
+        },
+
+        // renders tables of similar players and of players to compare from the columnar result
+        render_similar_players: function(result, style_table) {
+            const no_update = window.dash_clientside.no_update;
+            if (result === null || result === undefined) {
+                return [no_update, no_update, no_update, no_update];
+            }
+
+            const columns = Object.keys(result).filter(column => Array.isArray(result[column]));
+            const rows = result.player_details.map((_, i) => {
+                const row = {};
+                columns.forEach(column => row[column] = result[column][i]);
+                return row;
+            });
+
+            return [rows,
+                    Object.assign({}, style_table, {display: 'block'}),
+                    [{'0': result.query_player}],
+                    result.player_details.map(player_details => ({'0': player_details}))];
+        },
+
+        // updates weight of the other player when the weight of one player is input
+        update_players_weights: function(player_1_weight, player_2_weight) {
+            const triggered = window.dash_clientside.callback_context.triggered.map(trigger => trigger.prop_id);
+            const no_update = window.dash_clientside.no_update;
+
+            if (triggered.includes('player_2_weight_dropdown.value')) {
+                if (player_2_weight === null || player_2_weight === undefined) {
+                    return [null, no_update];
+                }
+                return [`${100 - parseInt(player_2_weight)}%`, no_update];
+            }
+            if (player_1_weight === null || player_1_weight === undefined) {
+                return [no_update, null];
+            }
+            return [no_update, `${100 - parseInt(player_1_weight)}%`];
+        }
+    }
+});
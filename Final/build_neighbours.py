@@ -0,0 +1,69 @@
+# Run with `python build_neighbours.py` after preprocessing to precompute the top neighbours of every player for default
+# traits weights, which `launch_dashboard.py` memory-maps at startup.
+
+# import packages
+import numpy as np
+import argparse
+import json
+import os
+import helper_functions
+
+# constants
+NEIGHBOURS_K = 200
+BLOCK_SIZE = 512
+
+def build_position_neighbours(index, k=NEIGHBOURS_K, block_size=BLOCK_SIZE):
+
+    num_rows = len(index.df)
+    k = min(k, num_rows)
+    neighbour_rows = np.full([num_rows, k], -1, dtype=np.int32)
+    neighbour_scores = np.full([num_rows, k], np.nan, dtype=np.float32)
+
+    # score blocks of players against all players of the position
+    for start in range(0, num_rows, block_size):
+        block = index.get_raw_traits(slice(start, start + block_size))
+        identical_rows = [index.raw_traits_rows[raw_traits.tobytes()] for raw_traits in block]
+        similarity_scores = helper_functions.get_scores_matrix(block, index.raw_traits_np, None, identical_rows)
+
+        # remove rows of each player name
+        for i in range(len(block)):
+            similarity_scores[i, index.player_name_rows[index.df.player_name[start + i]]] = -np.inf
+
+        # get indices of top k scores in descending order
+        top_k_indices = np.argpartition(similarity_scores, -k, axis=1)[:, -k:]
+        top_k_scores = np.take_along_axis(similarity_scores, top_k_indices, axis=1)
+        order = np.flip(np.argsort(top_k_scores, axis=1), axis=1)
+        top_k_indices = np.take_along_axis(top_k_indices, order, axis=1)
+        top_k_scores = np.take_along_axis(top_k_scores, order, axis=1)
+
+        # pad removed rows with -1
+        valid = np.isfinite(top_k_scores)
+        neighbour_rows[start:start + len(block)] = np.where(valid, top_k_indices, -1)
+        neighbour_scores[start:start + len(block)] = np.where(valid, top_k_scores, np.nan)
+
+    return neighbour_rows, neighbour_scores
+
+def build_neighbours(k=NEIGHBOURS_K):
+
+    os.makedirs(helper_functions.NEIGHBOURS_PATH, exist_ok=True)
+
+    fingerprints = {}
+    for position, index in helper_functions.similarity_indexes.items():
+        neighbour_rows, neighbour_scores = build_position_neighbours(index, k)
+        np.save(os.path.join(helper_functions.NEIGHBOURS_PATH, f'{position}_rows.npy'), neighbour_rows)
+        np.save(os.path.join(helper_functions.NEIGHBOURS_PATH, f'{position}_scores.npy'), neighbour_scores)
+        fingerprints[position] = index.fingerprint()
+
+    # write manifest last so that partially written neighbours are never loaded
+    manifest_path = os.path.join(helper_functions.NEIGHBOURS_PATH, 'neighbours.json')
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump({'k': k, 'fingerprints': fingerprints}, f)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--k', type=int, default=NEIGHBOURS_K, help='number of neighbours to keep for each player')
+    args = parser.parse_args()
+
+    build_neighbours(args.k)
+    print('Neighbours built!')
@@ -0,0 +1,161 @@
+# Script containing functions to save and load dataframes in a typed columnar format, with one `.npy` file per column
+# that can be memory-mapped on load.
+
+# import packages
+import pandas as pd
+import numpy as np
+import json
+import os
+
+# constants
+MANIFEST_FILE = 'columns.json'
+
+def save_columnar_df(df, path, categorical_columns=(), float32_columns=()):
+
+    os.makedirs(path, exist_ok=True)
+
+    # save index and each column as an array
+    np.save(os.path.join(path, 'index.npy'), df.index.to_numpy())
+    columns = []
+    for column in df.columns:
+        values = df[column]
+        column_path = os.path.join(path, f'{column}.npy')
+
+        # categorical columns, including string columns with missing values, are saved as codes
+        if column in categorical_columns or (values.dtype.kind not in 'biuf' and values.isna().any()):
+            categorical = pd.Categorical(values)
+            np.save(column_path, categorical.codes)
+            columns.append({'name': column, 'kind': 'categorical', 'categories': categorical.categories.tolist()})
+        elif column in float32_columns:
+            np.save(column_path, values.to_numpy(dtype=np.float32))
+            columns.append({'name': column, 'kind': 'numeric'})
+        elif values.dtype.kind in 'biuf':
+            np.save(column_path, values.to_numpy())
+            columns.append({'name': column, 'kind': 'numeric'})
+        else:
+            np.save(column_path, values.to_numpy(dtype=str))
+            columns.append({'name': column, 'kind': 'string'})
+
+    # write manifest last so that a partially written dataframe is never loaded
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump({'columns': columns}, f)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+def save_columnar_chunks(read_chunks, path, categorical_columns=(), float32_columns=()):
+
+    # first pass over the chunks of the dataframe for the number of rows, dtypes, missing values and string lengths
+    num_rows = 0
+    index_dtype = None
+    dtypes = {}
+    has_missing = {}
+    max_lengths = {}
+    categories = {column: set() for column in categorical_columns}
+    for chunk in read_chunks():
+        num_rows += len(chunk)
+        index_dtype = chunk.index.dtype if index_dtype is None else np.result_type(index_dtype, chunk.index.dtype)
+        for column in chunk.columns:
+            values = chunk[column]
+            if values.dtype.kind in 'biuf' and dtypes.get(column, values.dtype) is not None:
+                dtypes[column] = np.result_type(dtypes.get(column, values.dtype), values.dtype)
+            else:
+                dtypes[column] = None
+                lengths = values.dropna().str.len()
+                max_lengths[column] = max(max_lengths.get(column, 1), int(lengths.max()) if len(lengths) else 1)
+            has_missing[column] = has_missing.get(column, False) or bool(values.isna().any())
+            if column in categories:
+                categories[column].update(values.dropna())
+
+    # string columns with missing values are saved as codes as well, whose categories need another pass
+    missing_columns = [column for column in dtypes if column not in categories and dtypes[column] is None and has_missing[column]]
+    categories.update({column: set() for column in missing_columns})
+    if missing_columns:
+        for chunk in read_chunks():
+            for column in missing_columns:
+                categories[column].update(chunk[column].dropna())
+    categories = {column: sorted(values) for column, values in categories.items()}
+
+    # dtype and manifest entry of each column, as saved by save_columnar_df
+    os.makedirs(path, exist_ok=True)
+    columns = []
+    column_dtypes = {}
+    for column in dtypes:
+        if column in categories:
+            column_dtypes[column] = pd.Categorical([], categories=categories[column]).codes.dtype
+            columns.append({'name': column, 'kind': 'categorical', 'categories': categories[column]})
+        elif column in float32_columns:
+            column_dtypes[column] = np.dtype(np.float32)
+            columns.append({'name': column, 'kind': 'numeric'})
+        elif dtypes[column] is not None:
+            column_dtypes[column] = dtypes[column]
+            columns.append({'name': column, 'kind': 'numeric'})
+        else:
+            column_dtypes[column] = np.dtype(f'<U{max_lengths[column]}')
+            columns.append({'name': column, 'kind': 'string'})
+
+    # second pass appending each chunk to the arrays after their headers, so that no column is held in memory
+    files = {column: open(os.path.join(path, f'{column}.npy'), 'wb') for column in ['index'] + list(dtypes)}
+    try:
+        for column, dtype in [('index', index_dtype)] + list(column_dtypes.items()):
+            header = {'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False, 'shape': (num_rows,)}
+            np.lib.format.write_array_header_1_0(files[column], header)
+        for chunk in read_chunks():
+            files['index'].write(chunk.index.to_numpy(dtype=index_dtype).tobytes())
+            for column, dtype in column_dtypes.items():
+                if column in categories:
+                    array = pd.Categorical(chunk[column], categories=categories[column]).codes
+                else:
+                    array = chunk[column].to_numpy(dtype=dtype)
+                files[column].write(np.ascontiguousarray(array, dtype=dtype).tobytes())
+    finally:
+        for f in files.values():
+            f.close()
+
+    # write manifest last so that a partially written dataframe is never loaded
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump({'columns': columns}, f)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+def load_columnar_df(path, mmap_mode='r'):
+
+    with open(os.path.join(path, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+
+    # load each column, memory-mapping the arrays
+    data = {}
+    for column in manifest['columns']:
+        values = np.load(os.path.join(path, f'{column["name"]}.npy'), mmap_mode=mmap_mode)
+        if column['kind'] == 'categorical':
+            data[column['name']] = pd.Categorical.from_codes(values, column['categories'])
+        elif column['kind'] == 'string':
+            data[column['name']] = values.astype(object)
+        else:
+            data[column['name']] = values
+    index = np.load(os.path.join(path, 'index.npy'), mmap_mode=mmap_mode)
+
+    # keep one block per column so that columns are not copied out of the memory-mapped arrays into consolidated blocks
+    return pd.DataFrame(data, index=index, copy=False)
+
+def to_decimal_float(values):
+
+    # float32 values as float64 of their shortest decimal, so that 2.45 is shown as 2.45 rather than 2.450000047683716
+    values = np.asarray(values)
+    if values.dtype == np.float32:
+        return values.astype(str).astype(float)
+
+    return values.astype(float)
+
+def is_columnar_df_current(path, csv_path):
+
+    # columnar dataframe is current if it exists and is not older than the csv file
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return False
+    if not os.path.exists(csv_path):
+        return True
+
+    return os.path.getmtime(manifest_path) >= os.path.getmtime(csv_path)
+
+if __name__ == '__main__':
+    print('This file should not be called directly!')
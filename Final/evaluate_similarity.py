@@ -0,0 +1,840 @@
+# Run with `python evaluate_similarity.py` to check the similarity engine against the reference implementation.
+
+# import packages
+import numpy as np
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+import subprocess
+import sys
+import mmap
+import os
+import json
+import tempfile
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+from plotly.utils import PlotlyJSONEncoder
+import helper_functions
+from ann_index import IVFIndex
+from search_index import tokenise
+from columnar_data import save_columnar_df, save_columnar_chunks, MANIFEST_FILE
+import preprocess_data
+
+# constants
+TOLERANCE = 1e-9
+# tolerance of scores summed from per-trait products stored in float32
+COMPACT_TOLERANCE = 1e-5
+SAMPLE_SIZE = 50
+SEED = 0
+NUM_WORKERS = 4
+NUM_THREADS = 16
+NUM_REWEIGHTS = 50
+ANN_RECALL_TARGETS = [0.8, 0.9, 0.95, 0.99]
+ANN_POOL_SIZE = 500000
+NUM_CHART_QUERIES = 2
+STREAM_CHUNKSIZES = [40, 97]
+STREAM_MEMORY_COPIES = [10, 20, 40, 80]
+STREAM_MEMORY_CHUNKSIZE = 5000
+
+def reference_scores(player_traits, others_traits, weights):
+
+    # compute similarity scores one row at a time with the reference function
+    similarity_scores = np.zeros([others_traits.shape[0]])
+    for i in range(others_traits.shape[0]):
+        similarity_scores[i] = helper_functions.weighted_cosine_similarity_score(player_traits, others_traits[i], weights)
+
+    # rescale similarity scores as per afl metric
+    similarity_scores = 1 - (2 / np.pi) * np.arccos(similarity_scores)
+
+    # normalise similarity scores
+    similarity_scores = (similarity_scores - similarity_scores.min()) / (1 - similarity_scores.min())
+
+    return similarity_scores
+
+def check_scores_parity(sample_size=SAMPLE_SIZE, seed=SEED):
+
+    rng = np.random.default_rng(seed)
+    max_error = 0
+    reference_time = 0
+    vectorised_time = 0
+
+    for position in sorted(set(helper_functions.df_full.position)):
+        raw_traits_np = helper_functions.df_full[helper_functions.df_full.position == position][helper_functions.RAW_TRAITS].to_numpy()
+
+        # include an all-zero row to exercise the zero vector case
+        raw_traits_np = np.vstack([raw_traits_np, np.zeros(raw_traits_np.shape[1])])
+
+        for player_index in rng.choice(raw_traits_np.shape[0] - 1, size=min(sample_size, raw_traits_np.shape[0] - 1), replace=False):
+            player_traits = raw_traits_np[player_index]
+            weights = rng.choice([1, 3, 5, 7, 9], size=raw_traits_np.shape[1])
+
+            start = time.perf_counter()
+            expected = reference_scores(player_traits, raw_traits_np, weights)
+            reference_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            actual = helper_functions.get_scores(player_traits, raw_traits_np, weights)
+            vectorised_time += time.perf_counter() - start
+
+            # identical vectors score 1 and zero vectors score 0 before rescaling
+            raw_scores = helper_functions.weighted_cosine_similarity_scores(player_traits, raw_traits_np, weights)
+            assert raw_scores[player_index] == 1, 'Identical vectors should score 1'
+            assert raw_scores[-1] == 0, 'Zero vectors should score 0'
+
+            max_error = max(max_error, np.abs(expected - actual).max())
+
+    assert max_error < TOLERANCE, f'Vectorised scores differ from reference scores by {max_error}'
+
+    print(f'Scores parity: max abs error {max_error:.2e}, reference {reference_time:.2f}s, '
+          f'vectorised {vectorised_time:.2f}s ({reference_time / vectorised_time:.0f}x)')
+
+def check_filters_parity(sample_size=SAMPLE_SIZE, seed=SEED):
+
+    rng = np.random.default_rng(seed)
+    leagues = helper_functions.get_all_leagues()
+
+    for position, index in helper_functions.similarity_indexes.items():
+        primary_positions = index.primary_positions
+
+        for _ in range(sample_size):
+            min_age = int(rng.choice([helper_functions.MIN_AGE, 21, 25]))
+            filters = {'seasons': rng.choice([None, '2019', '2020', '2021', '2020-2021', '2019-2021']),
+                       'leagues': None if rng.random() < 0.5 else list(rng.choice(leagues, size=2, replace=False)),
+                       'primary_positions': None if rng.random() < 0.5 else primary_positions[:1],
+                       'min_age': None if rng.random() < 0.5 else min_age,
+                       'max_age': None if rng.random() < 0.5 else min_age + 8,
+                       'min_total_mins': None if rng.random() < 0.5 else int(rng.integers(720, 2500)),
+                       'min_rating': None if rng.random() < 0.5 else round(float(rng.uniform(0.6, 3.5)), 1)}
+
+            expected = np.zeros(len(index.df), dtype=bool)
+            expected[helper_functions.filter_df(index.metadata_df, filters).index] = True
+            actual = index.filter_index.keep_mask(filters)
+
+            assert np.array_equal(expected, actual), f'Filter index differs from filter_df for {position} {filters}'
+
+    print(f'Filters parity: {sample_size} random filters per position match filter_df')
+
+def scores_tolerance():
+
+    # scores summed from per-trait products stored in float32 differ from full scores by float32 rounding
+    if helper_functions.SCORING_DTYPES[helper_functions.TRAITS_STORAGE] == np.float64:
+        return TOLERANCE
+
+    return COMPACT_TOLERANCE
+
+def check_batch_parity(sample_size=SAMPLE_SIZE, seed=SEED):
+
+    rng = np.random.default_rng(seed)
+    filters = {'seasons': None, 'leagues': None, 'primary_positions': None, 'min_age': None, 'max_age': 30,
+               'min_total_mins': None, 'min_rating': None}
+    traits_weights = rng.choice([1, 3, 5, 7, 9], size=len(helper_functions.RAW_TRAITS))
+
+    # single and blended queries across all positions
+    queries = []
+    for position, index in helper_functions.similarity_indexes.items():
+        player_details = rng.choice(index.player_details, size=2 * sample_size, replace=False).tolist()
+        queries += player_details[:sample_size]
+        queries += list(zip(player_details[sample_size::2], player_details[sample_size + 1::2]))
+
+    start = time.perf_counter()
+    expected = []
+    for query in queries:
+        if isinstance(query, str):
+            _, top_n_dict = helper_functions.similar_players_df_1(query, helper_functions.get_position(query),
+                                                                  traits_weights=traits_weights, filters=filters)
+        else:
+            _, top_n_dict = helper_functions.similar_players_df_2(query[0], query[1], helper_functions.get_position(query[0]),
+                                                                  player_weights=[0.3, 0.7], traits_weights=traits_weights, filters=filters)
+        expected.append(top_n_dict)
+    single_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = helper_functions.similar_players_batch(queries, player_weights=[0.3, 0.7], traits_weights=traits_weights, filters=filters)
+    batch_time = time.perf_counter() - start
+
+    tolerance = scores_tolerance()
+    for query, expected_dict, actual_dict in zip(queries, expected, actual):
+        assert list(expected_dict) == list(actual_dict), f'Batch ranking differs for query {query}'
+        assert np.allclose(list(expected_dict.values()), list(actual_dict.values()), rtol=0, atol=tolerance), f'Batch scores differ for query {query}'
+
+    print(f'Batch parity: {len(queries)} queries match, single {single_time:.2f}s, batch {batch_time:.2f}s '
+          f'({single_time / batch_time:.0f}x)')
+
+def check_neighbours_parity(sample_size=SAMPLE_SIZE, seed=SEED):
+
+    rng = np.random.default_rng(seed)
+    default_filters = {'seasons': None, 'leagues': None, 'primary_positions': None, 'min_age': None, 'max_age': None,
+                       'min_total_mins': None, 'min_rating': None}
+
+    if any(index.neighbour_rows is None for index in helper_functions.similarity_indexes.values()):
+        print('Neighbours parity: skipped, run `python build_neighbours.py` first')
+        return
+
+    num_lookups = 0
+    for position, index in helper_functions.similarity_indexes.items():
+        for player_details in rng.choice(index.player_details, size=sample_size, replace=False):
+            for filters in (None, default_filters):
+                player_index = index.player_details_rows[player_details]
+                keep_mask = index.filter_index.keep_mask(filters) if filters is not None else np.ones(len(index.df), dtype=bool)
+                keep_mask[index.player_name_rows[index.df.player_name[player_index]]] = False
+
+                # precomputed neighbours are stored as float32
+                actual = helper_functions.lookup_neighbours(index, player_index, keep_mask, helper_functions.TOP_N)
+                if actual is None:
+                    continue
+                expected = helper_functions.similar_players_batch([player_details], filters=filters)[0]
+                num_lookups += 1
+
+                assert list(expected) == list(actual), f'Neighbours ranking differs for {player_details}'
+                assert np.allclose(list(expected.values()), list(actual.values()), rtol=0, atol=1e-6), f'Neighbours scores differ for {player_details}'
+
+    print(f'Neighbours parity: {num_lookups} lookups match exact scoring')
+
+def check_reweight_parity(sample_size=SAMPLE_SIZE, num_reweights=NUM_REWEIGHTS, seed=SEED):
+
+    rng = np.random.default_rng(seed)
+    tolerance = scores_tolerance()
+
+    # one query player per position rescored with many traits weights, as when moving sliders
+    full_time = 0
+    reweight_time = 0
+    for position, index in helper_functions.similarity_indexes.items():
+        for player_details in rng.choice(index.player_details, size=sample_size // 10, replace=False):
+            player_traits = index.raw_traits_np[index.player_details_rows[player_details]]
+            for _ in range(num_reweights):
+                traits_weights = rng.choice([1, 3, 5, 7, 9], size=len(helper_functions.RAW_TRAITS))
+
+                start = time.perf_counter()
+                expected = helper_functions.get_scores(player_traits, index.raw_traits_np, traits_weights)
+                full_time += time.perf_counter() - start
+
+                start = time.perf_counter()
+                actual = helper_functions.get_reweighted_scores(index, player_traits, traits_weights)
+                reweight_time += time.perf_counter() - start
+
+                assert np.allclose(expected, actual, rtol=0, atol=tolerance), f'Reweighted scores differ for {player_details}'
+
+        # cached products stay within the bytes bound, and products larger than the bound are not cached
+        assert index.query_products_bytes == sum(map(helper_functions.query_products_nbytes, index.query_products.values())) <= \
+            helper_functions.QUERY_PRODUCTS_CACHE_BYTES, f'Cached products of {position} exceed bytes bound'
+        cache_bytes = helper_functions.QUERY_PRODUCTS_CACHE_BYTES
+        helper_functions.QUERY_PRODUCTS_CACHE_BYTES = helper_functions.query_products_nbytes(index.get_query_products(player_traits)) - 1
+        index.query_products.clear()
+        index.query_products_bytes = 0
+        expected = helper_functions.get_reweighted_scores(index, player_traits, traits_weights)
+        assert not index.query_products and np.array_equal(expected, helper_functions.get_reweighted_scores(index, player_traits, traits_weights)), \
+            f'Products larger than bytes bound were cached for {position}'
+        helper_functions.QUERY_PRODUCTS_CACHE_BYTES = cache_bytes
+
+    print(f'Reweight parity: scores match, full {full_time:.2f}s, reweighted {reweight_time:.2f}s '
+          f'({full_time / reweight_time:.1f}x)')
+
+def check_result_cache(sample_size=SAMPLE_SIZE, seed=SEED):
+
+    rng = np.random.default_rng(seed)
+    result_cache = helper_functions.result_cache
+    result_cache.clear()
+    leagues = helper_functions.get_all_leagues()
+    filters = {'seasons': None, 'leagues': leagues, 'primary_positions': None, 'min_age': 20, 'max_age': 30,
+               'min_total_mins': None, 'min_rating': None}
+    traits_weights = rng.choice([1, 3, 5, 7, 9], size=len(helper_functions.RAW_TRAITS))
+
+    queries = [(player_details, position) for position, index in helper_functions.similarity_indexes.items()
+               for player_details in rng.choice(index.player_details, size=sample_size, replace=False)][:result_cache.maxsize]
+
+    # first queries are misses, repeated queries with reordered filter values are hits
+    hits, misses = result_cache.hits, result_cache.misses
+    start = time.perf_counter()
+    expected = [helper_functions.similar_players_df_1(player_details, position, traits_weights=traits_weights, filters=filters)
+                for player_details, position in queries]
+    miss_time = time.perf_counter() - start
+
+    filters = dict(filters, leagues=leagues[::-1])
+    start = time.perf_counter()
+    actual = [helper_functions.similar_players_df_1(player_details, position, traits_weights=list(traits_weights), filters=filters)
+              for player_details, position in queries]
+    hit_time = time.perf_counter() - start
+
+    for (player_details, _), (expected_df, expected_dict), (actual_df, actual_dict) in zip(queries, expected, actual):
+        assert expected_df.equals(actual_df) and expected_dict == actual_dict, f'Cached result differs for {player_details}'
+    assert result_cache.hits - hits == len(queries), f'Expected {len(queries)} hits, got {result_cache.hits - hits}'
+
+    # cached results are copies
+    actual[-1][1].clear()
+    assert helper_functions.similar_players_df_1(*queries[-1], traits_weights=traits_weights, filters=filters)[1] == expected[-1][1], \
+        'Cached result was modified by caller'
+
+    print(f'Result cache: {result_cache.hits - hits} hits, {result_cache.misses - misses} misses, '
+          f'miss {miss_time:.2f}s, hit {hit_time:.3f}s ({miss_time / hit_time:.0f}x)')
+    result_cache.clear()
+
+def check_single_flight(num_threads=NUM_THREADS, seed=SEED):
+
+    rng = np.random.default_rng(seed)
+    result_cache = helper_functions.result_cache
+    position = rng.choice(list(helper_functions.similarity_indexes))
+    player_details = rng.choice(helper_functions.similarity_indexes[position].player_details)
+    traits_weights = rng.choice([1, 3, 5, 7, 9], size=len(helper_functions.RAW_TRAITS))
+
+    # count computations while many threads submit the same query at the same moment
+    result_cache.clear()
+    coalesced = result_cache.coalesced
+    num_computations = 0
+    compute_similar_players_df_1 = helper_functions.compute_similar_players_df_1
+
+    def counted_compute(*args):
+
+        nonlocal num_computations
+        num_computations += 1
+        time.sleep(0.1)
+
+        return compute_similar_players_df_1(*args)
+
+    barrier = threading.Barrier(num_threads)
+
+    def query(_):
+
+        barrier.wait()
+
+        return helper_functions.similar_players_df_1(player_details, position, traits_weights=traits_weights)
+
+    helper_functions.compute_similar_players_df_1 = counted_compute
+    try:
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            results = list(executor.map(query, range(num_threads)))
+    finally:
+        helper_functions.compute_similar_players_df_1 = compute_similar_players_df_1
+
+    assert num_computations == 1, f'Expected 1 computation, got {num_computations}'
+    assert all(top_n_dict == results[0][1] for _, top_n_dict in results), 'Concurrent callers got distinct results'
+
+    print(f'Single flight: {num_threads} concurrent identical queries, {num_computations} computation, '
+          f'{result_cache.coalesced - coalesced} coalesced')
+    result_cache.clear()
+
+def query_bytes(index):
+
+    # bytes read by each reweighted query, which are the per-trait products and masks of the query player and the squared
+    # raw traits
+    query_products = index.get_query_products(index.get_raw_traits(0))
+
+    return (helper_functions.query_products_nbytes(query_products) - query_products.squared_vec.nbytes +
+            index.squared_raw_traits_np.nbytes)
+
+def check_storage_parity(traits_storages=('float32', 'int16'), sample_size=SAMPLE_SIZE, seed=SEED):
+
+    rng = np.random.default_rng(seed)
+    top_n = helper_functions.TOP_N
+
+    # float64 traits of the csv file, as the columnar dataframe already stores traits as float32
+    df_full = pd.read_csv(helper_functions.DF_FULL_PATH, index_col=0)
+
+    for traits_storage in traits_storages:
+        num_queries = 0
+        num_same_rankings = 0
+        recalls = []
+        max_error = 0
+        float64_bytes = 0
+        compact_bytes = 0
+        float64_query_bytes = 0
+        compact_query_bytes = 0
+        num_rows = 0
+        num_changed_rows = 0
+        for position in helper_functions.similarity_indexes:
+            position_df = df_full[df_full.position == position]
+            float64_index = helper_functions.SimilarityIndex(position_df, 'float64')
+            compact_index = helper_functions.SimilarityIndex(position_df, traits_storage)
+            float64_bytes += float64_index.raw_traits_np.nbytes
+            compact_bytes += compact_index.raw_traits_np.nbytes
+            float64_query_bytes += query_bytes(float64_index)
+            compact_query_bytes += query_bytes(compact_index)
+
+            # rows whose raw traits are changed by the compact storage beyond float32 precision
+            compact_raw_traits = compact_index.raw_traits_np.astype(float)
+            if traits_storage == 'int16':
+                compact_raw_traits /= 10 ** helper_functions.TRAITS_DECIMALS
+            num_rows += len(position_df)
+            num_changed_rows += int((~np.isclose(compact_raw_traits, float64_index.raw_traits_np, rtol=1e-6, atol=1e-6)).any(axis=1).sum())
+
+            # top n of random queries and traits weights scored as by the dashboard on float64 and compact raw traits
+            for row in rng.choice(len(position_df), size=sample_size, replace=False):
+                traits_weights = rng.choice([1, 3, 5, 7, 9], size=len(helper_functions.RAW_TRAITS))
+                expected = helper_functions.get_reweighted_scores(float64_index, float64_index.get_raw_traits(row), traits_weights)
+                actual = helper_functions.get_reweighted_scores(compact_index, compact_index.get_raw_traits(row), traits_weights)
+                expected_top_n = np.argsort(-expected, kind='stable')[:top_n]
+                actual_top_n = np.argsort(-actual, kind='stable')[:top_n]
+
+                num_queries += 1
+                num_same_rankings += int((expected_top_n == actual_top_n).all())
+                recalls.append(len(set(expected_top_n).intersection(actual_top_n)) / top_n)
+                max_error = max(max_error, np.abs(expected - actual).max())
+
+        print(f'Storage parity ({traits_storage}): {num_same_rankings}/{num_queries} ({num_same_rankings / num_queries:.0%}) identical '
+              f'top {top_n} rankings, recall {np.mean(recalls):.3f}, max abs error {max_error:.2e}, '
+              f'{num_changed_rows / num_rows:.0%} of rows changed, raw traits {float64_bytes / 1e6:.2f}MB -> '
+              f'{compact_bytes / 1e6:.2f}MB ({float64_bytes / compact_bytes:.0f}x smaller), read by each query '
+              f'{float64_query_bytes / 1e6:.2f}MB -> {compact_query_bytes / 1e6:.2f}MB ({float64_query_bytes / compact_query_bytes:.1f}x smaller)')
+
+def is_memory_mapped(array):
+
+    # whether an array is a view of a memory-mapped file
+    while array is not None:
+        if isinstance(array, (np.memmap, mmap.mmap)):
+            return True
+        array = getattr(array, 'base', None)
+
+    return False
+
+def worker_memory(_):
+
+    # bytes of index arrays memory-mapped from shared files and private to this worker
+    shared_bytes = 0
+    private_bytes = 0
+    for index in helper_functions.similarity_indexes.values():
+        for array in index.shared_arrays.values():
+            if is_memory_mapped(array):
+                shared_bytes += array.nbytes
+            else:
+                private_bytes += array.nbytes
+
+    # bytes of dataframe columns of the indexes memory-mapped from the columnar dataframe and private to this worker,
+    # where string columns are python objects
+    shared_df_bytes = 0
+    private_df_bytes = 0
+    for index in helper_functions.similarity_indexes.values():
+        for column in index.df.columns:
+            values = index.df[column]
+            array = values.array.codes if isinstance(values.dtype, pd.CategoricalDtype) else values.to_numpy()
+            if array.dtype != object and is_memory_mapped(array):
+                shared_df_bytes += values.memory_usage(index=False, deep=True)
+            else:
+                private_df_bytes += values.memory_usage(index=False, deep=True)
+
+    # private and proportional set size of this worker in kB, on linux only
+    memory = {}
+    if os.path.exists('/proc/self/smaps_rollup'):
+        with open('/proc/self/smaps_rollup') as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if name in ('Pss', 'Private_Clean', 'Private_Dirty'):
+                    memory[name] = int(value.split()[0])
+
+    # keep worker busy so that each task runs in its own worker
+    time.sleep(1)
+
+    return shared_bytes, private_bytes, shared_df_bytes, private_df_bytes, memory
+
+def report_shared_memory(num_workers=NUM_WORKERS):
+
+    # workers import helper_functions from scratch as under a multi-process server
+    with multiprocessing.get_context('spawn').Pool(num_workers) as pool:
+        results = pool.map(worker_memory, range(num_workers), chunksize=1)
+
+    print(f'Shared memory ({num_workers} workers):')
+    for worker, (shared_bytes, private_bytes, shared_df_bytes, private_df_bytes, memory) in enumerate(results):
+        process_memory = ', '.join(f'{name} {value / 1024:.1f}MB' for name, value in memory.items())
+        print(f'  worker {worker}: index arrays {shared_bytes / 1e6:.2f}MB shared, {private_bytes / 1e6:.2f}MB private, '
+              f'dataframe columns {shared_df_bytes / 1e6:.2f}MB shared, {private_df_bytes / 1e6:.2f}MB private'
+              f'{", " + process_memory if process_memory else ""}')
+
+def figure_json(fig):
+
+    # figure as parsed json, as sent to the browser
+    return json.loads(json.dumps(fig, cls=PlotlyJSONEncoder))
+
+def reference_charts(query_result, similar_player_details):
+
+    # charts built trace by trace with plotly, as before figure skeletons
+    row = query_result.player_rows[similar_player_details]
+    rating_fig = go.Figure()
+    rating_fig.add_trace(go.Indicator(mode='number', value=query_result.ratings[0], title=query_result.query_player,
+                                      domain={'row': 0, 'column': 0}))
+    rating_fig.add_trace(go.Indicator(mode='number+delta', value=query_result.ratings[row],
+                                      delta=dict(reference=query_result.ratings[0]), title=similar_player_details,
+                                      domain={'row': 1, 'column': 0}))
+    rating_fig.update_layout(height=800, width=1200, grid={'rows': 2, 'columns': 1}, template='plotly_dark', font={'size': 18})
+
+    figures = [rating_fig]
+    for traits_values, traits_display in ((query_result.composite_traits, helper_functions.COMPOSITE_TRAITS_DISPLAY),
+                                          (query_result.raw_traits, helper_functions.RAW_TRAITS_DISPLAY)):
+        values_1 = traits_values[0].tolist()
+        values_2 = traits_values[row].tolist()
+        diff = [value_1 - value_2 for value_1, value_2 in zip(values_1, values_2)]
+        fig = make_subplots(rows=1, cols=2, specs=[[{'type': 'polar'}, {'type': 'bar'}]],
+                            subplot_titles=('Radar Chart', 'Difference Bar Chart'))
+        for values, name, color in ((values_1, query_result.query_player, helper_functions.DARK_BLUE_HEX),
+                                    (values_2, similar_player_details, helper_functions.DARK_ORANGE_HEX)):
+            fig.add_trace(go.Scatterpolar(r=values + values[:1], theta=traits_display + traits_display[:1], fill='toself',
+                                          name=name, marker=dict(color=color)), row=1, col=1)
+        for positive, name, color in ((True, query_result.query_player, helper_functions.DARK_BLUE_HEX),
+                                      (False, similar_player_details, helper_functions.DARK_ORANGE_HEX)):
+            fig.add_trace(go.Bar(x=[trait for trait, value in zip(traits_display, diff) if (value >= 0) == positive],
+                                 y=[value for value in diff if (value >= 0) == positive],
+                                 name=name, marker=dict(color=color), showlegend=False), row=1, col=2)
+        fig.update_layout(height=800, width=1200, margin=dict(l=90, r=90, t=90, b=10), polar={'radialaxis': {'visible': True}},
+                          showlegend=True, legend=dict(x=0, y=-0.3), template='plotly_dark', font={'size': 14})
+        if traits_display is helper_functions.RAW_TRAITS_DISPLAY and len(query_result.query_players) == 2:
+            fig.update_polars(radialaxis=dict(range=[0, max(values_1 + values_1[:1])]))
+        fig.update_xaxes(categoryorder='array', categoryarray=traits_display, row=1, col=2)
+        fig.update_yaxes(range=[-4, 4])
+        figures.append(fig)
+
+    return figures
+
+def check_figure_cache(sample_size=NUM_CHART_QUERIES, seed=SEED):
+
+    rng = np.random.default_rng(seed)
+    helper_functions.figure_cache.clear()
+
+    # query results of one and two query players of each position
+    query_results = []
+    for position, index in helper_functions.similarity_indexes.items():
+        for player_1_details, player_2_details in rng.choice(index.player_details, size=(sample_size, 2), replace=False):
+            similar_players = list(helper_functions.similar_players_df_1(player_1_details, position)[1])
+            query_results.append(helper_functions.get_query_result([player_1_details], similar_players, position))
+            similar_players = list(helper_functions.similar_players_df_2(player_1_details, player_2_details, position,
+                                                                         player_weights=[0.7, 0.3])[1])
+            query_results.append(helper_functions.get_query_result([player_1_details, player_2_details], similar_players,
+                                                                   position, [0.7, 0.3]))
+
+    # charts cloned from figure skeletons match charts built trace by trace
+    start = time.perf_counter()
+    reference = [[reference_charts(query_result, similar_player_details) for similar_player_details in query_result.player_rows]
+                 for query_result in query_results]
+    reference_time = time.perf_counter() - start
+    start = time.perf_counter()
+    cloned = [[helper_functions.query_result_charts(query_result, similar_player_details) for similar_player_details in query_result.player_rows]
+              for query_result in query_results]
+    cloned_time = time.perf_counter() - start
+    for query_result, charts, reference_charts_list in zip(query_results, cloned, reference):
+        for similar_player_details, figures, expected in zip(query_result.player_rows, charts, reference_charts_list):
+            assert [figure_json(fig) for fig in figures] == [figure_json(fig) for fig in expected], \
+                f'Cloned charts differ for {query_result.query_player} and {similar_player_details}'
+
+    # clicking back and forth between the first two similar players of each query
+    hits = helper_functions.figure_cache.stats()['hits']
+    start = time.perf_counter()
+    num_clicks = 0
+    for query_result in query_results:
+        for similar_player_details in list(query_result.player_rows)[:2] * 5:
+            helper_functions.query_result_charts(query_result, similar_player_details)
+            num_clicks += 1
+    cached_time = time.perf_counter() - start
+    hits = helper_functions.figure_cache.stats()['hits'] - hits
+
+    num_charts = sum(len(charts) for charts in cloned)
+    print(f'Figure cache: charts of {num_charts} similar players match, {reference_time / num_charts * 1000:.1f}ms built '
+          f'trace by trace vs {cloned_time / num_charts * 1000:.2f}ms cloned, {hits}/{num_clicks * len(helper_functions.chart_functions)} '
+          f'charts of clicks back and forth cached '
+          f'({cached_time / num_clicks * 1000:.3f}ms)')
+
+def check_query_result_store(sample_size=NUM_CHART_QUERIES, seed=SEED):
+
+    rng = np.random.default_rng(seed)
+    indexes = helper_functions.similarity_indexes
+
+    # one and two query players of each position with their similar players
+    queries = []
+    for position, index in indexes.items():
+        for player_1_details, player_2_details in rng.choice(index.player_details, size=(sample_size, 2), replace=False):
+            similar_players = list(helper_functions.similar_players_df_1(player_1_details, position)[1])
+            queries.append(([player_1_details], None, similar_players, position))
+            player_weights = [0.7, 0.3]
+            similar_players = list(helper_functions.similar_players_df_2(player_1_details, player_2_details, position,
+                                                                         player_weights=player_weights)[1])
+            queries.append(([player_1_details, player_2_details], player_weights, similar_players, position))
+
+    tokens = [helper_functions.query_result_store.put(helper_functions.get_query_result(query_players, similar_players, position, player_weights))
+              for query_players, player_weights, similar_players, position in queries]
+
+    # charts from stored query results, without access to the similarity indexes or their dataframes
+    helper_functions.figure_cache.clear()
+    helper_functions.similarity_indexes = {}
+    try:
+        start = time.perf_counter()
+        stored_charts = [[helper_functions.query_result_charts(helper_functions.query_result_store.get(token), similar_player_details)
+                          for similar_player_details in similar_players]
+                         for token, (_, _, similar_players, _) in zip(tokens, queries)]
+        stored_time = time.perf_counter() - start
+    finally:
+        helper_functions.similarity_indexes = indexes
+
+    # charts looked up from the similarity indexes for each similar player
+    start = time.perf_counter()
+    for charts, (query_players, player_weights, similar_players, position) in zip(stored_charts, queries):
+        for figures, similar_player_details in zip(charts, similar_players):
+            if len(query_players) == 1:
+                expected = [helper_functions.rating_indicators_1(query_players[0], similar_player_details, position),
+                            helper_functions.composite_traits_charts_1(query_players[0], similar_player_details, position),
+                            helper_functions.raw_traits_charts_1(query_players[0], similar_player_details, position)]
+            else:
+                expected = [helper_functions.rating_indicators_2(*query_players, similar_player_details, position, player_weights),
+                            helper_functions.composite_traits_charts_2(*query_players, similar_player_details, position, player_weights),
+                            helper_functions.raw_traits_charts_2(*query_players, similar_player_details, position, player_weights)]
+            assert [figure_json(fig) for fig in figures] == [figure_json(fig) for fig in expected], \
+                f'Charts of stored query result differ for {query_players} and {similar_player_details}'
+    index_time = time.perf_counter() - start
+
+    num_charts = sum(len(similar_players) for _, _, similar_players, _ in queries)
+    print(f'Query result store: charts of {num_charts} similar players match, '
+          f'{stored_time / num_charts * 1000:.2f}ms from stored query results vs {index_time / num_charts * 1000:.2f}ms from indexes')
+
+def synthetic_raw_df(position, seed=SEED, num_copies=1):
+
+    rng = np.random.default_rng(seed)
+
+    # raw rows of single seasons of a position, copied into new leagues of new players, where dob is an integer column
+    df = helper_functions.df_full[(helper_functions.df_full.position == position) & helper_functions.df_full.season.isin(helper_functions.SEASONS)]
+    copies = np.repeat(np.arange(num_copies), len(df))
+    player_names = np.tile(df.player_name.to_numpy(dtype=str), num_copies) + np.where(copies > 0, ' ' + copies.astype(str), '')
+    teams = np.tile(df.team.astype(str).to_numpy(dtype=str), num_copies)
+    seasons = np.tile(df.season.to_numpy(dtype=str), num_copies)
+    leagues = np.tile(df.league.astype(str).to_numpy(dtype=str), num_copies) + np.where(copies > 0, ' ' + copies.astype(str), '')
+    raw_df = pd.DataFrame({'Ord': np.arange(1, len(copies) + 1),
+                           'Player Name': np.char.add(np.char.add(np.char.add(player_names, ' '), np.char.add(teams, ' ')), seasons),
+                           'Team ID': teams,
+                           'Season': seasons.astype(int),
+                           'League': leagues,
+                           'Primary Position': np.tile(df.primary_position.astype(str).to_numpy(), num_copies),
+                           'Nationality': np.tile(df.nationality.astype(str).to_numpy(), num_copies),
+                           'DOB': pd.array(np.tile(df.dob.astype(int).to_numpy(), num_copies), dtype='Int64'),
+                           'Apps': np.tile(df.apps.astype(int).to_numpy(), num_copies),
+                           'Mins': np.tile(df.mins.astype(int).to_numpy(), num_copies)})
+    for column in ['rating'] + preprocess_data.TRAIT_COLUMNS:
+        raw_df[column.replace('_', ' ').title()] = np.round(rng.uniform(0, 5, len(raw_df)), 2)
+
+    # a few blank dob values, so that chunks with and without blanks read dob as float and as int
+    raw_df.loc[rng.choice(len(raw_df), size=5 * num_copies, replace=False), 'DOB'] = pd.NA
+
+    # second rows of players who moved team within a season at the end of the file, so that the rows of one player season
+    # are aggregated in different chunks
+    transfers_df = raw_df.iloc[rng.choice(len(raw_df), size=len(raw_df) // 20, replace=False)].copy()
+    transfers_df['Team ID'] = transfers_df['Team ID'] + ' B'
+    transfers_df['Player Name'] = [player_details.replace(f' {season}', f' B {season}') for player_details, season in zip(transfers_df['Player Name'], transfers_df.Season)]
+    for column in ['Rating'] + [column.replace('_', ' ').title() for column in preprocess_data.TRAIT_COLUMNS]:
+        transfers_df[column] = np.round(rng.uniform(0, 5, len(transfers_df)), 2)
+    raw_df = pd.concat([raw_df, transfers_df], ignore_index=True)
+    raw_df['Ord'] = np.arange(1, len(raw_df) + 1)
+
+    return raw_df
+
+def check_streaming_parity(positions=('CB', 'CF'), chunksizes=STREAM_CHUNKSIZES):
+
+    # output of each position streamed in chunks is identical to output of a normal run
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as path:
+        for position in positions:
+            raw_path = os.path.join(path, f'data_{position.lower()}.csv')
+            synthetic_raw_df(position).to_csv(raw_path, index=False)
+            expected_path = os.path.join(path, f'{position}.csv')
+            preprocess_data.preprocess_position(position, raw_path, expected_path)
+            with open(expected_path) as f:
+                expected = f.read()
+            for chunksize in chunksizes:
+                actual_path = os.path.join(path, f'{position}_{chunksize}.csv')
+                preprocess_data.preprocess_position(position, raw_path, actual_path, chunksize)
+                with open(actual_path) as f:
+                    assert f.read() == expected, f'Streamed output of {position} in chunks of {chunksize} rows differs'
+
+        # columnar dataframe saved chunk by chunk is identical to the one saved from the whole dataframe
+        df = pd.read_csv(expected_path, dtype={column: str for column in preprocess_data.STRING_COLUMNS}, float_precision='round_trip',
+                         keep_default_na=False, na_values=[''])
+        save_columnar_df(df, os.path.join(path, 'expected'), preprocess_data.CATEGORICAL_COLUMNS, preprocess_data.TRAIT_COLUMNS)
+        save_columnar_chunks(lambda: preprocess_data.read_output_chunks(expected_path, chunksizes[0]), os.path.join(path, 'actual'),
+                             preprocess_data.CATEGORICAL_COLUMNS, preprocess_data.TRAIT_COLUMNS)
+        for name in ['index.npy', MANIFEST_FILE] + [f'{column}.npy' for column in df.columns]:
+            with open(os.path.join(path, 'expected', name), 'rb') as expected_file, open(os.path.join(path, 'actual', name), 'rb') as actual_file:
+                assert expected_file.read() == actual_file.read(), f'Columnar file {name} saved in chunks differs'
+
+    print(f'Streaming parity: {len(positions)} synthetic positions with blank dob values and transfers match in chunks of '
+          f'{chunksizes} rows, as does the columnar dataframe ({time.perf_counter() - start:.2f}s)')
+
+def preprocess_memory(path, chunksize):
+
+    # peak resident memory in MB of preprocessing the raw csv files in a directory in a process of its own, on linux only,
+    # read from VmHWM since ru_maxrss keeps the peak of the parent process across exec
+    command = ['-c', 'import preprocess_data; preprocess_data.preprocess(full=True, chunksize=%r); '
+                     'print(open("/proc/self/status").read().split("VmHWM:")[1].split()[0])' % chunksize]
+    output = subprocess.run([sys.executable] + command, cwd=path, check=True, capture_output=True, text=True,
+                            env=dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))).stdout
+
+    return int(output.split()[-1]) / 1024
+
+def report_streaming_memory(copies=STREAM_MEMORY_COPIES, chunksize=STREAM_MEMORY_CHUNKSIZE):
+
+    # peak memory of preprocessing synthetic raw csv files of increasing size, normally and streamed in chunks
+    print(f'Streaming memory (chunks of {chunksize} rows):')
+    for num_copies in copies:
+        with tempfile.TemporaryDirectory() as path:
+            os.makedirs(os.path.join(path, 'Data'))
+            num_rows = 0
+            for seed, (position, raw_path) in enumerate(preprocess_data.POSITION_DATA_PATHS.items()):
+                raw_df = synthetic_raw_df(position, seed, num_copies)
+                raw_df.to_csv(os.path.join(path, raw_path), index=False)
+                num_rows += len(raw_df)
+            print(f'  {num_rows} raw rows: peak {preprocess_memory(path, None):.0f}MB unchunked, '
+                  f'{preprocess_memory(path, chunksize):.0f}MB streamed')
+
+def check_search_parity(sample_size=SAMPLE_SIZE, seed=SEED):
+
+    rng = np.random.default_rng(seed)
+    all_player_details = helper_functions.get_all_player_details()
+
+    # prefixes of one or two words of random player details, with and without a position
+    start = time.perf_counter()
+    for player_details in rng.choice(all_player_details, size=sample_size, replace=False):
+        words = tokenise(player_details)
+        prefixes = [word[:rng.integers(1, len(word) + 1)] for word in rng.choice(words, size=min(2, len(words)), replace=False)]
+        search_value = ' '.join(prefixes)
+
+        for query_player_details in (None, player_details):
+            expected = [details for details in all_player_details
+                        if all(any(word.startswith(prefix) for word in tokenise(details)) for prefix in prefixes)]
+            if query_player_details is not None:
+                position = helper_functions.get_position(query_player_details)
+                expected = [details for details in expected if details != query_player_details and helper_functions.get_position(details) == position]
+            actual = helper_functions.search_player_details(search_value, query_player_details, limit=len(all_player_details))
+            assert sorted(expected) == sorted(actual), f'Search results differ for {search_value!r}'
+
+    # dropdown options of accent-folded words of player details with accents, such as 'mbappe' for 'Mbappé', are kept by
+    # the client-side filter of the dropdown, which matches typed words to lowercase words of labels and search fields
+    accented_player_details = [details for details in all_player_details if ' '.join(tokenise(details)) != ' '.join(details.lower().split())]
+    num_dropped = 0
+    for player_details in rng.choice(accented_player_details, size=sample_size, replace=False):
+        search_value = ' '.join(tokenise(player_details)[:2])
+        options = helper_functions.get_player_options(search_value, selected_player_details=player_details)
+        assert player_details in [option['value'] for option in options], f'Selected player details missing for {search_value!r}'
+        for option in [option for option in options if 'search' in option]:
+            words = (option['label'] + ' ' + option['search']).lower().split()
+            assert all(any(word.startswith(typed_word) for word in words) for typed_word in search_value.split()), \
+                f'Dropdown drops {option["label"]!r} for {search_value!r}'
+        num_dropped += not all(any(word.startswith(typed_word) for word in player_details.lower().split()) for typed_word in search_value.split())
+    assert num_dropped, 'No accent-folded search would be dropped by labels alone'
+
+    print(f'Search parity: {2 * sample_size} searches match a scan of all player details, {num_dropped}/{sample_size} '
+          f'accent-folded searches kept by the dropdown that labels alone would drop ({time.perf_counter() - start:.2f}s)')
+
+def report_ann(recall_targets=ANN_RECALL_TARGETS, sample_size=SAMPLE_SIZE, seed=SEED):
+
+    rng = np.random.default_rng(seed)
+    indexes = helper_functions.similarity_indexes
+
+    # disable precomputed neighbours and cached results so that every query is scored
+    helper_functions.result_cache.clear()
+    neighbours = {position: (index.neighbour_rows, index.neighbour_scores) for position, index in indexes.items()}
+    for index in indexes.values():
+        index.neighbour_rows, index.neighbour_scores = None, None
+
+    queries = [(player_details, position) for position, index in indexes.items()
+               for player_details in rng.choice(index.player_details, size=sample_size, replace=False)]
+
+    # exact top n of each query
+    start = time.perf_counter()
+    exact = [helper_functions.similar_players_df_1(player_details, position)[1] for player_details, position in queries]
+    exact_time = (time.perf_counter() - start) / len(queries)
+    print(f'ANN report ({len(queries)} queries): exact {exact_time * 1000:.2f}ms per query')
+
+    for recall_target in recall_targets:
+        helper_functions.build_ann_indexes(recall_target)
+        num_probes = {position: f'{index.ann_index.num_probes}/{len(index.ann_index.centroids)}' for position, index in indexes.items()}
+
+        start = time.perf_counter()
+        approximate = [helper_functions.similar_players_df_1(player_details, position)[1] for player_details, position in queries]
+        approximate_time = (time.perf_counter() - start) / len(queries)
+
+        recall = np.mean([len(set(exact_dict).intersection(approximate_dict)) / len(exact_dict)
+                          for exact_dict, approximate_dict in zip(exact, approximate)])
+
+        # error of similarity scores shown for players found by both, as scores are normalised by an estimated minimum
+        score_errors = [abs(approximate_dict[player_details] - exact_dict[player_details])
+                        for exact_dict, approximate_dict in zip(exact, approximate) for player_details in approximate_dict
+                        if player_details in exact_dict]
+        print(f'  target {recall_target:.2f}: recall {recall:.3f}, score error mean {np.mean(score_errors):.4f} max {np.max(score_errors):.4f}, '
+              f'{approximate_time * 1000:.2f}ms per query, probes {num_probes}')
+
+    # restore exact scoring and precomputed neighbours
+    for position, index in indexes.items():
+        index.ann_index = None
+        index.neighbour_rows, index.neighbour_scores = neighbours[position]
+    helper_functions.result_cache.clear()
+
+def report_ann_pool(pool_size=ANN_POOL_SIZE, recall_targets=ANN_RECALL_TARGETS, sample_size=SAMPLE_SIZE, seed=SEED):
+
+    rng = np.random.default_rng(seed)
+
+    # synthetic pool of players sampled from all positions with noise on raw traits
+    raw_traits_np = helper_functions.df_full[helper_functions.RAW_TRAITS].to_numpy(dtype=float)
+    pool = raw_traits_np[rng.integers(raw_traits_np.shape[0], size=pool_size)]
+    pool = np.clip(pool + rng.normal(scale=0.3, size=pool.shape), 0, 5).round(2)
+    queries = rng.choice(pool_size, size=sample_size, replace=False)
+
+    # exact top n of each query
+    start = time.perf_counter()
+    exact = []
+    for query in queries:
+        scores = helper_functions.get_scores(pool[query], pool, None)
+        scores[query] = -np.inf
+        top_n_rows = np.argpartition(scores, -helper_functions.TOP_N)[-helper_functions.TOP_N:]
+        exact.append(dict(zip(top_n_rows, scores[top_n_rows])))
+    exact_time = (time.perf_counter() - start) / len(queries)
+
+    start = time.perf_counter()
+    ann_index = IVFIndex(pool)
+    print(f'ANN pool report ({pool_size} rows, {len(ann_index.centroids)} clusters, built in {time.perf_counter() - start:.1f}s): '
+          f'exact {exact_time * 1000:.2f}ms per query')
+
+    for recall_target in recall_targets:
+        ann_index.calibrate(recall_target)
+
+        # candidates from the index rescored exactly
+        start = time.perf_counter()
+        recalls = []
+        score_errors = []
+        for query, exact_top_n in zip(queries, exact):
+            candidate_rows, min_rows = ann_index.search(pool[query], top_n=helper_functions.TOP_N)
+            rows = np.union1d(candidate_rows, min_rows)
+            scores = np.full(pool_size, -np.inf)
+            scores[rows] = helper_functions.get_scores(pool[query], pool[rows], None)
+            scores[query] = -np.inf
+            scores[np.setdiff1d(rows, candidate_rows)] = -np.inf
+            top_n_rows = np.argpartition(scores, -helper_functions.TOP_N)[-helper_functions.TOP_N:]
+            recalls.append(len(set(exact_top_n).intersection(top_n_rows)) / helper_functions.TOP_N)
+            score_errors.extend(abs(scores[row] - exact_top_n[row]) for row in top_n_rows if row in exact_top_n)
+        approximate_time = (time.perf_counter() - start) / len(queries)
+
+        print(f'  target {recall_target:.2f}: recall {np.mean(recalls):.3f}, score error mean {np.mean(score_errors):.4f} '
+              f'max {np.max(score_errors):.4f}, {approximate_time * 1000:.2f}ms per query, '
+              f'probes {ann_index.num_probes}/{len(ann_index.centroids)}')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ann', action='store_true', help='report recall and latency of the approximate nearest neighbour index')
+    parser.add_argument('--ann-pool-size', type=int, default=0, help='also report on a synthetic pool of this many players')
+    parser.add_argument('--workers', type=int, default=0, help='report memory of this many worker processes')
+    parser.add_argument('--streaming-memory', action='store_true', help='report peak memory of preprocessing growing synthetic raw data')
+    args = parser.parse_args()
+
+    check_scores_parity()
+    check_filters_parity()
+    check_batch_parity()
+    check_neighbours_parity()
+    check_reweight_parity()
+    check_result_cache()
+    check_single_flight()
+    check_storage_parity()
+    check_search_parity()
+    check_streaming_parity()
+    check_query_result_store()
+    check_figure_cache()
+
+    if args.ann:
+        report_ann()
+    if args.ann_pool_size > 0:
+        report_ann_pool(args.ann_pool_size)
+    if args.workers > 0:
+        report_shared_memory(args.workers)
+    if args.streaming_memory:
+        report_streaming_memory()
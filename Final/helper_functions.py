@@ -1,11 +1,22 @@
 # Script containing functions necessary for 'launch_dashboard.py'.
 
 # import packages
+from collections import namedtuple, OrderedDict
 from plotly.subplots import make_subplots
 import plotly.graph_objects as go
+import plotly.io as pio
 import pandas as pd
 import numpy as np
 import warnings
+import hashlib
+import json
+import os
+import secrets
+import threading
+import time
+from columnar_data import load_columnar_df, is_columnar_df_current, to_decimal_float, MANIFEST_FILE
+from ann_index import IVFIndex
+from search_index import PlayerSearchIndex, SEARCH_LIMIT
 warnings.filterwarnings('ignore')
 
 # constants
@@ -16,6 +27,7 @@ RAW_TRAITS_DISPLAY = ['Goals', 'Shots', 'Conversion', 'Positioning', 'Assists',
                       'Involvement', 'Accuracy', 'Intent', 'Receiving', 'Aerial', 'On ball', 'Off ball', 'Fouls']
 COMPOSITE_TRAITS_DISPLAY = ['Scoring', 'Creating', 'Passing', 'Defending']
 SIMILARITY_TABLE_HEADERS = ['RANK', 'PLAYER NAME', 'NATIONALITY', 'AGE', 'TEAM', 'PRIMARY POSITION', 'SIMILARITY SCORE']
+SIMILARITY_RESULT_COLUMNS = ['rank', 'player_name', 'nationality', 'age', 'team', 'primary_position', 'similarity_score']
 TOP_N = 20
 MIN_AGE = 17
 MAX_AGE = 45
@@ -25,97 +37,621 @@ MIN_RATING = 0.6
 MAX_RATING = 4.9
 DARK_BLUE_HEX = '#4074B2'
 DARK_ORANGE_HEX = '#E77052'
+CATEGORICAL_FILTER_COLUMNS = ['season', 'league', 'primary_position']
+RANGE_FILTER_COLUMNS = ['age', 'total_mins', 'rating']
 
-# paths to dataframe csv files
+# paths to dataframe csv file and columnar dataframe
 DF_FULL_PATH = 'Data/df_full.csv'
+DF_FULL_COLUMNAR_PATH = 'Data/df_full'
 
-# load dataframes for each position
-df_full = pd.read_csv(DF_FULL_PATH, index_col=0)
+# recall target of the approximate nearest neighbour index, or None to score all players exactly
+ANN_RECALL_TARGET = None
 
-def get_position(player_details):
+# storage of raw traits used for scoring, as 'float64', 'float32' or 'int16' fixed point rounded to TRAITS_DECIMALS decimals
+# int16 is lossy: traits of blended periods have more decimals, so it changes rows and reorders rankings, at rates reported
+# by the storage parity check of evaluate_similarity.py
+TRAITS_STORAGE = 'float32'
+TRAITS_DECIMALS = 2
 
-    df_full_copy = df_full.copy()
+# precision of the squared raw traits and per-trait products read by each query for each storage of raw traits, where
+# squares of fixed point raw traits are exact in float32
+SCORING_DTYPES = {'float64': np.float64, 'float32': np.float32, 'int16': np.float32}
+# number of rows of compact matrices cast to float at a time when summing weighted per-trait products
+SCORING_BLOCK_ROWS = 4096
+
+# maximum number of bytes of per-trait products of query players cached in each position index of each worker, where
+# the products of a query player larger than this are not cached
+QUERY_PRODUCTS_CACHE_BYTES = 128 * 2 ** 20
+
+# maximum number of cached similarity query results and their time to live in seconds, or None to never expire
+RESULT_CACHE_SIZE = 256
+RESULT_CACHE_TTL = None
+
+# maximum number of query results kept on the server for the charts, each looked up by a token held by the browser
+QUERY_RESULT_STORE_SIZE = 256
+QUERY_RESULT_TOKEN_BYTES = 8
+
+# maximum number of cached charts, each of one chart type for a query and a similar player
+FIGURE_CACHE_SIZE = 768
+
+# arrays of each similarity index attached from memory-mapped files shared by all workers, and path to those files
+SHARED_INDEX_ARRAYS = ['raw_traits_np', 'squared_raw_traits_np', 'ratings', 'composite_traits_np']
+SHARED_ARRAYS_PATH = 'Data/shared_arrays'
+
+# path to precomputed neighbours of each player for default traits weights
+NEIGHBOURS_PATH = 'Data/neighbours'
+
+def load_df_full():
+
+    # load columnar dataframe if it is up to date, otherwise fall back to csv file
+    if is_columnar_df_current(DF_FULL_COLUMNAR_PATH, DF_FULL_PATH):
+        return load_columnar_df(DF_FULL_COLUMNAR_PATH)
+
+    return pd.read_csv(DF_FULL_PATH, index_col=0)
+
+def split_positions(df):
+
+    # dataframe of each position, sliced without copying the columns when the rows of the position are contiguous
+    positions = df.position.to_numpy()
+    position_dfs = {}
+    for position in df.position.unique():
+        rows = np.flatnonzero(positions == position)
+        if rows[-1] - rows[0] + 1 == len(rows):
+            position_dfs[position] = df.iloc[rows[0]:rows[-1] + 1]
+        else:
+            position_dfs[position] = df.iloc[rows]
+
+    return position_dfs
+
+class FilterIndex:
+
+    def __init__(self, metadata_df, arrays=None):
+
+        self.num_rows = len(metadata_df)
+        if arrays is None:
+            arrays = FilterIndex.build_arrays(metadata_df)
+
+        # boolean mask of rows for each value of categorical columns
+        self.value_masks = {}
+        for column in CATEGORICAL_FILTER_COLUMNS:
+            self.value_masks[column] = dict(zip(pd.unique(metadata_df[column].to_numpy()), arrays[f'{column}_masks']))
+
+        # row ids sorted by value for range columns, with missing values last
+        self.sorted_columns = {column: (arrays[f'{column}_order'], arrays[f'{column}_sorted_values']) for column in RANGE_FILTER_COLUMNS}
+
+    @staticmethod
+    def build_arrays(metadata_df):
+
+        arrays = {}
+
+        # stacked masks of rows for each unique value of categorical columns, in order of appearance
+        for column in CATEGORICAL_FILTER_COLUMNS:
+            values = metadata_df[column].to_numpy()
+            arrays[f'{column}_masks'] = np.array([values == value for value in pd.unique(values)], dtype=bool).reshape(-1, len(values))
+
+        # row ids sorted by value and sorted values without missing values for range columns
+        for column in RANGE_FILTER_COLUMNS:
+            values = metadata_df[column].to_numpy(dtype=float)
+            order = np.argsort(values, kind='stable')
+            num_valid = int((~np.isnan(values)).sum())
+            arrays[f'{column}_order'] = order
+            arrays[f'{column}_sorted_values'] = values[order][:num_valid]
+
+        return arrays
+
+    def categorical_mask(self, column, values):
+
+        # union of masks of each value
+        mask = np.zeros(self.num_rows, dtype=bool)
+        for value in values:
+            if value in self.value_masks[column]:
+                mask |= self.value_masks[column][value]
+
+        return mask
+
+    def range_mask(self, column, min_value=None, max_value=None):
+
+        # binary search for the bounds in the sorted column
+        order, sorted_values = self.sorted_columns[column]
+        start = 0 if min_value is None else np.searchsorted(sorted_values, min_value, side='left')
+        end = len(sorted_values) if max_value is None else np.searchsorted(sorted_values, max_value, side='right')
+
+        mask = np.zeros(self.num_rows, dtype=bool)
+        mask[order[start:end]] = True
+
+        return mask
+
+    def keep_mask(self, filters):
+
+        # same defaults as filter_df
+        seasons = LATEST_SEASON if filters['seasons'] is None else filters['seasons']
+        min_age = MIN_AGE if filters['min_age'] is None else filters['min_age']
+        max_age = MAX_AGE if filters['max_age'] is None else filters['max_age']
+        min_total_mins = MIN_TOTAL_MINS if filters['min_total_mins'] is None else filters['min_total_mins']
+        min_rating = MIN_RATING if filters['min_rating'] is None else filters['min_rating']
+
+        # combine masks of each filter, skipping unset leagues and primary positions
+        mask = self.categorical_mask('season', [seasons])
+        if filters['leagues'] is not None:
+            mask &= self.categorical_mask('league', filters['leagues'])
+        if filters['primary_positions'] is not None:
+            mask &= self.categorical_mask('primary_position', filters['primary_positions'])
+        mask &= self.range_mask('age', min_age, max_age)
+        mask &= self.range_mask('total_mins', min_total_mins)
+        mask &= self.range_mask('rating', min_rating)
+
+        return mask
+
+QueryProducts = namedtuple('QueryProducts', ['products', 'squared_vec', 'zero_rows', 'identical_rows'])
+
+def query_products_nbytes(query_products):
+
+    # bytes held by the per-trait products and masks of a query player
+    return sum(array.nbytes for array in query_products)
+
+class SimilarityIndex:
+
+    def __init__(self, df, traits_storage=TRAITS_STORAGE, shared_arrays=None):
+
+        # position df with row ids starting from 0, sharing the columns of df
+        self.df = df.copy(deep=False)
+        self.df.index = pd.RangeIndex(len(df))
+
+        # arrays used for scoring, filters and charts, either memory-mapped from files shared by all workers or built
+        if shared_arrays is None:
+            shared_arrays = self.build_shared_arrays(traits_storage)
+        self.shared_arrays = shared_arrays
+        for name in SHARED_INDEX_ARRAYS:
+            setattr(self, name, shared_arrays[name])
+        for array in shared_arrays.values():
+            array.flags.writeable = False
+
+        # asserts that matrix has 2 dimensions
+        assert self.raw_traits_np.ndim == 2, 'Matrix should have 2 dimensions'
+
+        # player details and hash maps of player details and player names to rows
+        self.player_details = self.df.player_details.to_numpy()
+        self.player_details_rows = {player_details: row for row, player_details in enumerate(self.player_details)}
+        self.player_name_rows = {player_name: rows.tolist() for player_name, rows in self.df.groupby('player_name', sort=False).indices.items()}
+
+        # hash map of raw traits, cast to float as in queries, to rows with identical raw traits
+        self.raw_traits_rows = {}
+        for row, raw_traits in enumerate(self.raw_traits_np.astype(float)):
+            self.raw_traits_rows.setdefault(raw_traits.tobytes(), []).append(row)
+
+        # cache of per-trait products of recent query players, used to rescore when only weights change
+        self.query_products = OrderedDict()
+        self.query_products_bytes = 0
+        self.query_products_lock = threading.Lock()
+
+        # metadata columns used by filter_df
+        self.metadata_df = self.df[CATEGORICAL_FILTER_COLUMNS + RANGE_FILTER_COLUMNS]
+        self.filter_index = FilterIndex(self.metadata_df, shared_arrays)
+        self.player_details.flags.writeable = False
+
+        # all primary positions
+        self.primary_positions = sorted(set(self.df.primary_position))
+
+        # precomputed neighbours, loaded by load_neighbours
+        self.neighbour_rows = None
+        self.neighbour_scores = None
+
+        # approximate nearest neighbour index, built by build_ann_indexes
+        self.ann_index = None
+
+    def build_shared_arrays(self, traits_storage):
+
+        # contiguous matrix of raw traits only, where fixed point raw traits are scaled and rounded to integers
+        raw_traits_np = self.df[RAW_TRAITS].to_numpy(dtype=float)
+        if traits_storage == 'int16':
+            raw_traits_np = np.rint(raw_traits_np * 10 ** TRAITS_DECIMALS)
+            assert (np.abs(raw_traits_np) <= np.iinfo(np.int16).max).all(), 'Raw traits out of range of int16'
+        raw_traits_np = np.ascontiguousarray(raw_traits_np.astype(traits_storage))
+
+        # squared raw traits used to rescore when only weights change, and arrays used by the charts
+        arrays = {'raw_traits_np': raw_traits_np,
+                  'squared_raw_traits_np': (raw_traits_np.astype(float) ** 2).astype(SCORING_DTYPES[traits_storage]),
+                  'ratings': self.df.rating.to_numpy(),
+                  'composite_traits_np': np.ascontiguousarray(to_decimal_float(self.df[COMPOSITE_TRAITS].to_numpy()))}
+        arrays.update(FilterIndex.build_arrays(self.df[CATEGORICAL_FILTER_COLUMNS + RANGE_FILTER_COLUMNS]))
+
+        return arrays
+
+    def fingerprint(self):
+
+        # hash of player details and raw traits, which determine the neighbours
+        sha256 = hashlib.sha256()
+        sha256.update('\n'.join(self.player_details).encode())
+        sha256.update(self.raw_traits_np.tobytes())
+
+        return sha256.hexdigest()
+
+    def get_raw_traits(self, row):
+
+        # raw traits of a row as float, used for scoring in the units of the stored raw traits
+        return self.raw_traits_np[row].astype(float)
+
+    def get_query_products(self, vec):
+
+        vec = np.asarray(vec, dtype=float)
+        key = vec.tobytes()
+        with self.query_products_lock:
+            if key in self.query_products:
+                self.query_products.move_to_end(key)
+                return self.query_products[key]
+
+        # per-trait products of vec with each row in the precision of the squared raw traits, and masks of rows full of
+        # zeros and rows identical to vec
+        products = np.multiply(self.raw_traits_np, vec, dtype=self.squared_raw_traits_np.dtype)
+        query_products = QueryProducts(products=products, squared_vec=vec ** 2,
+                                       zero_rows=~(vec.any() & self.raw_traits_np.any(axis=1)),
+                                       identical_rows=(self.raw_traits_np == vec).all(axis=1))
+
+        # keep only the most recently used query players within the bytes bound
+        num_bytes = query_products_nbytes(query_products)
+        if num_bytes > QUERY_PRODUCTS_CACHE_BYTES:
+            return query_products
+        with self.query_products_lock:
+            if key not in self.query_products:
+                self.query_products[key] = query_products
+                self.query_products_bytes += num_bytes
+            while self.query_products_bytes > QUERY_PRODUCTS_CACHE_BYTES:
+                self.query_products_bytes -= query_products_nbytes(self.query_products.popitem(last=False)[1])
+
+        return query_products
+
+PlayerLocation = namedtuple('PlayerLocation', ['position', 'row', 'primary_position', 'season'])
+
+class PendingResult:
+
+    def __init__(self):
+
+        # set when the result or error of the computation is available
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+class ResultCache:
+
+    def __init__(self, maxsize=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL):
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.results = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        # computations in flight and number of callers that waited on them, and number of times the cache was cleared
+        self.pending = {}
+        self.coalesced = 0
+        self.generation = 0
+
+    def lookup(self, key):
+
+        # must be called while holding the lock
+        entry = self.results.get(key)
+
+        # return result if it has not expired, marking it as most recently used
+        if entry is not None and (self.ttl is None or time.monotonic() - entry[0] < self.ttl):
+            self.results.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        if entry is not None:
+            del self.results[key]
+
+        return None
+
+    def put(self, key, result, generation=None):
+
+        with self.lock:
+            # results computed before the cache was cleared belong to the previous dataset
+            if generation is not None and generation != self.generation:
+                return
+
+            self.results[key] = (time.monotonic(), result)
+            self.results.move_to_end(key)
+
+            # evict least recently used results
+            while len(self.results) > self.maxsize:
+                self.results.popitem(last=False)
+
+    def get_or_compute(self, key, compute):
+
+        with self.lock:
+            result = self.lookup(key)
+            if result is not None:
+                return result
+
+            # wait on an identical computation in flight instead of repeating it
+            pending = self.pending.get(key)
+            computing = pending is None
+            if computing:
+                pending = PendingResult()
+                self.pending[key] = pending
+                self.misses += 1
+                generation = self.generation
+            else:
+                self.coalesced += 1
+
+        if not computing:
+            pending.event.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.result
+
+        # first caller computes and shares the result or error with waiting callers
+        try:
+            pending.result = compute()
+            self.put(key, pending.result, generation)
+        except Exception as error:
+            pending.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.pending[key]
+            pending.event.set()
+
+        return pending.result
+
+    def clear(self):
+
+        with self.lock:
+            self.results.clear()
+            self.generation += 1
+
+    def stats(self):
+
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'coalesced': self.coalesced, 'size': len(self.results),
+                    'maxsize': self.maxsize}
+
+# cache of results of similarity queries
+result_cache = ResultCache()
+
+# ratings and traits of a query and its similar players, where row 0 is the query combined for two query players
+QueryResult = namedtuple('QueryResult', ['query_players', 'player_weights', 'query_player', 'player_rows', 'ratings',
+                                         'composite_traits', 'raw_traits'])
+
+class QueryResultStore:
+
+    def __init__(self, maxsize=QUERY_RESULT_STORE_SIZE):
+
+        self.maxsize = maxsize
+        self.results = OrderedDict()
+        self.lock = threading.Lock()
+
+    def put(self, query_result, token=None):
+
+        # short random token, so that tokens of different queries and workers do not collide
+        if token is None:
+            token = secrets.token_urlsafe(QUERY_RESULT_TOKEN_BYTES)
+
+        with self.lock:
+            self.results[token] = query_result
+            self.results.move_to_end(token)
+
+            # evict least recently used results
+            while len(self.results) > self.maxsize:
+                self.results.popitem(last=False)
+
+        return token
+
+    def get(self, token):
+
+        # None if the token was evicted or issued by another worker
+        with self.lock:
+            query_result = self.results.get(token)
+            if query_result is not None:
+                self.results.move_to_end(token)
+
+        return query_result
+
+    def clear(self):
+
+        with self.lock:
+            self.results.clear()
+
+# query results of the similar players tables, used by the charts
+query_result_store = QueryResultStore()
+
+# cache of charts of similar players
+figure_cache = ResultCache(FIGURE_CACHE_SIZE)
+
+def get_data_fingerprint():
+
+    # identity of the dataframe file loaded by load_df_full and of the traits storage and scoring precision, which
+    # determine the shared arrays
+    if is_columnar_df_current(DF_FULL_COLUMNAR_PATH, DF_FULL_PATH):
+        path = os.path.join(DF_FULL_COLUMNAR_PATH, MANIFEST_FILE)
+    else:
+        path = DF_FULL_PATH
+    stat = os.stat(path)
+
+    return hashlib.sha256(json.dumps([path, stat.st_mtime_ns, stat.st_size, TRAITS_STORAGE, TRAITS_DECIMALS, np.dtype(SCORING_DTYPES[TRAITS_STORAGE]).name]).encode()).hexdigest()
+
+def publish_shared_arrays(path=SHARED_ARRAYS_PATH):
+
+    # save arrays of each position built from the current dataframe rather than previously published arrays, replacing
+    # files so that workers still mapping old files are not affected
+    positions = {}
+    for position, index in similarity_indexes.items():
+        os.makedirs(os.path.join(path, position), exist_ok=True)
+        shared_arrays = index.build_shared_arrays(TRAITS_STORAGE)
+        for name, array in shared_arrays.items():
+            array_path = os.path.join(path, position, f'{name}.npy')
+            with open(array_path + '.tmp', 'wb') as f:
+                np.save(f, array)
+            os.replace(array_path + '.tmp', array_path)
+        positions[position] = sorted(shared_arrays)
+
+    # write manifest last so that partially written arrays are never attached
+    manifest_path = os.path.join(path, 'shared_arrays.json')
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump({'fingerprint': get_data_fingerprint(), 'positions': positions}, f)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+def load_shared_arrays(path=SHARED_ARRAYS_PATH):
 
-    # get player position
     try:
-        position = df_full_copy[df_full_copy.player_details==player_details].position.tolist()[0]
+        with open(os.path.join(path, 'shared_arrays.json')) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}
+
+    # memory-map arrays only if they were published from the current dataframe
+    if manifest['fingerprint'] != get_data_fingerprint():
+        return {}
 
-        return position
+    return {position: {name: np.load(os.path.join(path, position, f'{name}.npy'), mmap_mode='r') for name in names}
+            for position, names in manifest['positions'].items()}
+
+def load_neighbours():
+
+    try:
+        with open(os.path.join(NEIGHBOURS_PATH, 'neighbours.json')) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return
 
-    except:
+    # memory-map neighbours of positions whose data has not changed since they were built
+    for position, index in similarity_indexes.items():
+        if manifest['fingerprints'].get(position) == index.fingerprint():
+            index.neighbour_rows = np.load(os.path.join(NEIGHBOURS_PATH, f'{position}_rows.npy'), mmap_mode='r')
+            index.neighbour_scores = np.load(os.path.join(NEIGHBOURS_PATH, f'{position}_scores.npy'), mmap_mode='r')
+
+def build_ann_indexes(recall_target):
+
+    # build and calibrate an approximate nearest neighbour index for each position
+    for index in similarity_indexes.values():
+        index.ann_index = IVFIndex(index.raw_traits_np)
+        index.ann_index.calibrate(recall_target)
+
+    # cached results were scored without the index
+    result_cache.clear()
+
+def load_data():
+
+    global df_full, SEASONS, LATEST_SEASON, similarity_indexes, player_locations, player_search_index
+
+    # load dataframes for each position
+    df_full = load_df_full()
+
+    # single seasons in the dataframe, where the latest season is the default season filter
+    SEASONS = sorted(season for season in df_full.season.unique() if '-' not in season)
+    LATEST_SEASON = SEASONS[-1]
+
+    # build similarity index for each position, attaching shared arrays if published
+    shared_arrays = load_shared_arrays()
+    similarity_indexes = {position: SimilarityIndex(position_df, shared_arrays=shared_arrays.get(position))
+                          for position, position_df in split_positions(df_full).items()}
+
+    # hash map of player details to position, row id in the position index, primary position and season
+    player_locations = {player_details: PlayerLocation(position, row, primary_position, season)
+                        for position, index in similarity_indexes.items()
+                        for row, (player_details, primary_position, season) in enumerate(zip(index.player_details, index.df.primary_position, index.df.season))}
+
+    # prefix index of player details of single seasons sorted by rating in descending order, used by the player dropdowns
+    sorted_df = df_full[df_full.season.isin(SEASONS)].sort_values(by='rating', ascending=False)
+    player_search_index = PlayerSearchIndex(sorted_df.player_details.tolist(), sorted_df.position.tolist())
+
+    load_neighbours()
+    if ANN_RECALL_TARGET is not None:
+        build_ann_indexes(ANN_RECALL_TARGET)
+
+    # cached results, query results and charts belong to the previous dataset
+    result_cache.clear()
+    query_result_store.clear()
+    figure_cache.clear()
+
+load_data()
+
+def get_player_location(player_details):
+
+    # get player location
+    try:
+        return player_locations[player_details]
+
+    except KeyError:
         raise Exception('Player not in database')
 
+def get_position(player_details):
+
+    # get player position
+    return get_player_location(player_details).position
+
 def get_all_player_details():
 
     # sort df by rating in descending order
-    df_full_sorted = df_full.copy()
-    df_full_sorted = df_full_sorted[(df_full_sorted.season=='2019') | (df_full_sorted.season=='2020') | (df_full_sorted.season=='2021')]
+    df_full_sorted = df_full[df_full.season.isin(SEASONS)]
     df_full_sorted = df_full_sorted.sort_values(by='rating', ascending=False)
 
     return df_full_sorted.player_details.tolist()
 
-def get_position_player_details(player_details):
+def search_player_details(search_value, player_details=None, limit=SEARCH_LIMIT):
 
-    # get player position
-    df_full_copy = df_full.copy()
-    position = get_position(player_details)
+    # top player details matching the typed words, restricted to the position of player details and excluding it if given
+    if player_details is None:
+        return player_search_index.search(search_value, limit=limit)
 
-    # sort df by rating in descending order
-    position_df_sorted = df_full_copy[df_full_copy.position==position]
-    position_df_sorted = position_df_sorted[(position_df_sorted.season=='2019') | (position_df_sorted.season=='2020') | (position_df_sorted.season=='2021')]
-    position_df_sorted = position_df_sorted.sort_values(by='rating', ascending=False)
+    return player_search_index.search(search_value, position=get_position(player_details), exclude=player_details, limit=limit)
 
-    return position_df_sorted.player_details.tolist()
+def get_player_options(search_value, player_details=None, selected_player_details=None):
 
-def get_all_leagues():
+    # dropdown options of player details matching the typed words, searched by the typed text so that the dropdown does not
+    # drop matches whose labels have accents, such as 'Mbappé' for 'mbappe'
+    options = [{'label': details, 'value': details, 'search': search_value}
+               for details in search_player_details(search_value, player_details)]
+
+    # keep selected player details in options so that they stay selected
+    if selected_player_details is not None and all(option['value'] != selected_player_details for option in options):
+        options.append({'label': selected_player_details, 'value': selected_player_details})
+
+    return options
 
-    df_full_copy = df_full.copy()
+def get_all_periods():
 
-    return sorted(set(df_full_copy.league))
+    # multi-season periods sorted by latest season then by length
+    periods = [period for period in df_full.season.unique() if '-' in period]
+    periods = sorted(periods, key=lambda period: (-int(period.split('-')[1]), int(period.split('-')[1]) - int(period.split('-')[0])))
+
+    return [LATEST_SEASON] + periods
+
+def get_all_leagues():
+
+    return sorted(set(df_full.league))
 
 def get_primary_positions(player_details):
 
     # get player position
-    df_full_copy = df_full.copy()
     position = get_position(player_details)
 
-    return sorted(set(df_full_copy[df_full_copy.position==position].primary_position))
+    return list(similarity_indexes[position].primary_positions)
 
 def get_min_age():
 
-    df_full_copy = df_full.copy()
-
-    return int(df_full_copy.age.min())
+    return int(df_full.age.min())
 
 def get_max_age():
 
-    df_full_copy = df_full.copy()
-
-    return int(df_full_copy.age.max())
+    return int(df_full.age.max())
 
 def get_min_total_mins():
 
-    df_full_copy = df_full.copy()
-
-    return int(df_full_copy.total_mins.min())
+    return int(df_full.total_mins.min())
 
 def get_max_total_mins():
 
-    df_full_copy = df_full.copy()
-
-    return int(df_full_copy.total_mins.max())
+    return int(df_full.total_mins.max())
 
 def get_min_rating():
 
-    df_full_copy = df_full.copy()
-
-    return df_full_copy.rating.min()
+    return df_full.rating.min()
 
 def get_max_rating():
 
-    df_full_copy = df_full.copy()
-
-    return df_full_copy.rating.max()
+    return df_full.rating.max()
 
 def blank_figure():
 
@@ -126,6 +662,14 @@ def blank_figure():
 
     return fig
 
+def placeholder_figure():
+
+    # dark background of the charts without axes, a small stand-in for charts not built yet
+    background = pio.templates['plotly_dark'].layout.paper_bgcolor
+
+    return {'data': [], 'layout': {'height': 800, 'width': 1200, 'paper_bgcolor': background, 'plot_bgcolor': background,
+                                   'xaxis': {'visible': False}, 'yaxis': {'visible': False}}}
+
 def weighted_cosine_similarity_score(vec1, vec2, weights=None):
 
     # asserts that vec1 and vec2 have same length
@@ -161,12 +705,78 @@ def weighted_cosine_similarity_score(vec1, vec2, weights=None):
 
     return score
 
-def get_scores(player_traits, others_traits, weights):
+def weighted_cosine_similarity_scores(vec, matrix, weights=None):
 
-    # compute similarity scores
-    similarity_scores = np.zeros([others_traits.shape[0]])
-    for i in range(others_traits.shape[0]):
-        similarity_scores[i] = weighted_cosine_similarity_score(player_traits, others_traits[i], weights)
+    # asserts that vec has same length as matrix rows
+    assert len(vec) == matrix.shape[1], f'Vector has distinct shape ({len(vec)},) from matrix rows ({matrix.shape[1]},)'
+
+    # compact matrices are scored in float
+    vec = np.asarray(vec, dtype=float)
+
+    # asserts that weights have same length as vec and matrix rows
+    if weights is None:
+        weights = np.ones(len(vec))
+    else:
+        assert len(weights) == len(vec), f'Weights have distinct shape ({len(weights)},) from vectors ({len(vec)},)'
+        weights = np.asarray(weights, dtype=float)
+
+    # compute weighted dot products and lengths of all rows at once
+    weighted_matrix = matrix * weights
+    dot_products = weighted_matrix @ vec
+    weighted_lengths_matrix = np.sqrt(np.einsum('ij,ij->i', weighted_matrix, matrix))
+    weighted_length_vec = np.sqrt((vec ** 2) @ weights)
+
+    # compute cosine similarity scores, clipped so that rounding cannot push arccos out of its domain
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = dot_products / (weighted_length_vec * weighted_lengths_matrix)
+    scores = np.clip(scores, -1, 1)
+
+    # return 0 where either arrays is full of zeros
+    scores[~(vec.any() & matrix.any(axis=1))] = 0
+
+    # return 1 where two arrays are identical
+    scores[(matrix == vec).all(axis=1)] = 1
+
+    return scores
+
+def weighted_row_sums(matrix, weights):
+
+    # weighted sums of each row accumulated in float, casting compact matrices block by block so that no float copy of
+    # the whole matrix is made
+    if matrix.dtype == np.float64:
+        return matrix @ weights
+    sums = np.empty(len(matrix))
+    for start in range(0, len(matrix), SCORING_BLOCK_ROWS):
+        np.dot(matrix[start:start + SCORING_BLOCK_ROWS].astype(float), weights, out=sums[start:start + SCORING_BLOCK_ROWS])
+
+    return sums
+
+def reweighted_cosine_similarity_scores(query_products, squared_matrix, weights=None):
+
+    # asserts that weights have same length as products
+    if weights is None:
+        weights = np.ones(len(query_products.squared_vec))
+    else:
+        assert len(weights) == len(query_products.squared_vec), f'Weights have distinct shape ({len(weights)},) from vectors ({len(query_products.squared_vec)},)'
+        weights = np.asarray(weights, dtype=float)
+
+    # weighted dot products and lengths are sums of cached per-trait products
+    dot_products = weighted_row_sums(query_products.products, weights)
+    weighted_lengths_matrix = np.sqrt(weighted_row_sums(squared_matrix, weights))
+    weighted_length_vec = np.sqrt(query_products.squared_vec @ weights)
+
+    # compute cosine similarity scores, clipped so that rounding cannot push arccos out of its domain
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = dot_products / (weighted_length_vec * weighted_lengths_matrix)
+    scores = np.clip(scores, -1, 1)
+
+    # return 0 where either arrays is full of zeros and 1 where two arrays are identical
+    scores[query_products.zero_rows] = 0
+    scores[query_products.identical_rows] = 1
+
+    return scores
+
+def rescale_scores(similarity_scores):
 
     # rescale similarity scores as per afl metric
     similarity_scores = 1 - (2 / np.pi) * np.arccos(similarity_scores)
@@ -176,10 +786,92 @@ def get_scores(player_traits, others_traits, weights):
 
     return similarity_scores
 
+def get_scores(player_traits, others_traits, weights):
+
+    # compute similarity scores
+    similarity_scores = weighted_cosine_similarity_scores(player_traits, others_traits, weights)
+
+    return rescale_scores(similarity_scores)
+
+def get_reweighted_scores(index, player_traits, weights):
+
+    # compute similarity scores from cached per-trait products of the query player
+    query_products = index.get_query_products(player_traits)
+    similarity_scores = reweighted_cosine_similarity_scores(query_products, index.squared_raw_traits_np, weights)
+
+    return rescale_scores(similarity_scores)
+
+def weighted_cosine_similarity_matrix(vecs, matrix, weights=None, identical_rows=None):
+
+    # asserts that vecs have same length as matrix rows
+    assert vecs.shape[1] == matrix.shape[1], f'Vectors have distinct shape ({vecs.shape[1]},) from matrix rows ({matrix.shape[1]},)'
+
+    # compact matrices are scored in float
+    vecs = np.asarray(vecs, dtype=float)
+
+    # asserts that weights have same length as vecs and matrix rows
+    if weights is None:
+        weights = np.ones(vecs.shape[1])
+    else:
+        assert len(weights) == vecs.shape[1], f'Weights have distinct shape ({len(weights)},) from vectors ({vecs.shape[1]},)'
+        weights = np.asarray(weights, dtype=float)
+
+    # compute weighted dot products of all vecs and rows in one matrix product
+    weighted_matrix = matrix * weights
+    dot_products = vecs @ weighted_matrix.T
+    weighted_lengths_matrix = np.sqrt(np.einsum('ij,ij->i', weighted_matrix, matrix))
+    weighted_lengths_vecs = np.sqrt((vecs ** 2) @ weights)
+
+    # compute cosine similarity scores, clipped so that rounding cannot push arccos out of its domain
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = dot_products / np.outer(weighted_lengths_vecs, weighted_lengths_matrix)
+    scores = np.clip(scores, -1, 1)
+
+    # return 0 where either arrays is full of zeros
+    scores[~(vecs.any(axis=1)[:, None] & matrix.any(axis=1)[None, :])] = 0
+
+    # return 1 where two arrays are identical, using rows of identical vecs if given
+    if identical_rows is None:
+        scores[(vecs[:, None, :] == matrix[None, :, :]).all(axis=2)] = 1
+    else:
+        for i, rows in enumerate(identical_rows):
+            scores[i, rows] = 1
+
+    return scores
+
+def get_scores_matrix(players_traits, others_traits, weights, identical_rows=None):
+
+    # compute similarity scores for each player
+    similarity_scores = weighted_cosine_similarity_matrix(players_traits, others_traits, weights, identical_rows)
+
+    # rescale similarity scores as per afl metric
+    similarity_scores = 1 - (2 / np.pi) * np.arccos(similarity_scores)
+
+    # normalise similarity scores of each player
+    min_scores = similarity_scores.min(axis=1, keepdims=True)
+    similarity_scores = (similarity_scores - min_scores) / (1 - min_scores)
+
+    return similarity_scores
+
+def get_ann_scores(index, player_traits, weights, keep_mask, top_n):
+
+    # candidates from the most similar clusters and rows of the least similar clusters to estimate the minimum score
+    candidate_rows, min_rows = index.ann_index.search(player_traits, weights, keep_mask, top_n)
+    rows = np.union1d(candidate_rows, min_rows)
+
+    # rescore candidates exactly, normalising with the minimum score of the scored rows
+    similarity_scores = np.full(len(index.df), -np.inf)
+    similarity_scores[rows] = get_scores(player_traits, index.raw_traits_np[rows], weights)
+
+    candidate_mask = np.zeros(len(index.df), dtype=bool)
+    candidate_mask[candidate_rows] = True
+
+    return similarity_scores, candidate_mask
+
 def filter_df(df, filters):
 
     if filters['seasons'] is None:
-        seasons = '2021'
+        seasons = LATEST_SEASON
     else:
         seasons = filters['seasons']
 
@@ -235,52 +927,91 @@ def get_similar_players_df(results, df):
     # add new column for similarity scores
     similar_players_df['similarity_score'] = similar_players_df.player_details.map(results)
 
+    # sort dataframe in order of results, which are sorted by similarity score
+    result_order = {player_details: order for order, player_details in enumerate(all_player_details)}
+    similar_players_df = similar_players_df.iloc[np.argsort(similar_players_df.player_details.map(result_order).to_numpy())]
+
     # rearrange columns
     temp_cols = similar_players_df.columns.tolist()
     new_cols = temp_cols[1:2] + temp_cols[7:8] + temp_cols[9:10] + temp_cols[4:5] + temp_cols[6:7] + temp_cols[-1:]
     similar_players_df = similar_players_df[new_cols]
 
-    # sort dataframe by similarity score
-    similar_players_df = similar_players_df.sort_values(by='similarity_score', ascending=False)
-
     # insert a rank column
     rank_list = list(range(1, len(all_player_details)+1))
     similar_players_df.insert(0, 'Rank', rank_list)
 
-    # convert similarity scores into percentage
-    similar_players_df['similarity_score'] = similar_players_df['similarity_score'].mul(100).round(1).astype(str).add(' %')
-
-    # rename dataframe columns
+    # rename dataframe columns, where similarity scores are formatted as percentages by the dashboard
     similar_players_df.columns = SIMILARITY_TABLE_HEADERS
 
     return similar_players_df
 
+def get_similar_players_result(similar_players_df, results, query_player):
+
+    # columnar result with one list per column and numeric similarity scores
+    similar_players_result = {'query_player': query_player, 'player_details': list(results.keys())}
+    for column, header in zip(SIMILARITY_RESULT_COLUMNS, SIMILARITY_TABLE_HEADERS):
+        similar_players_result[column] = similar_players_df[header].tolist()
+
+    return similar_players_result
+
+def lookup_neighbours(index, player_index, keep_mask, top_n, traits_weights=None):
+
+    # only default traits weights, where all weights are equal, are precomputed
+    if index.neighbour_rows is None:
+        return None
+    if traits_weights is not None and (len(set(traits_weights)) != 1 or traits_weights[0] <= 0):
+        return None
+
+    # neighbours sorted by similarity score, where -1 pads players with fewer candidates than neighbours
+    rows = np.asarray(index.neighbour_rows[player_index])
+    scores = np.asarray(index.neighbour_scores[player_index])
+    all_candidates = (rows < 0).any()
+    scores = scores[rows >= 0]
+    rows = rows[rows >= 0]
+
+    # neighbours kept by filters are the top n unless too few of them are kept
+    keep = keep_mask[rows]
+    if keep.sum() < top_n and not all_candidates:
+        return None
+
+    return {index.player_details[row]: float(score) for row, score in zip(rows[keep][:top_n], scores[keep][:top_n])}
+
+def get_result_key(players_details, position, top_n, player_weights, traits_weights, filters):
+
+    # canonical weights, where weights of None are distinct from any explicit weights
+    player_weights = None if player_weights is None else tuple(float(weight) for weight in player_weights)
+    traits_weights = None if traits_weights is None else tuple(float(weight) for weight in traits_weights)
+
+    # canonical filters, where the order of values in lists does not matter
+    if filters is not None:
+        filters = tuple(sorted((name, tuple(sorted(value)) if isinstance(value, (list, tuple)) else value)
+                               for name, value in filters.items()))
+
+    return tuple(players_details), position, top_n, player_weights, traits_weights, filters
+
 def similar_players_df_1(player_details, position, top_n=TOP_N, traits_weights=None, filters=None):
 
-    # get position df
-    df = df_full[df_full.position==position]
-    df = df.reset_index(drop=True)
+    # return cached result of an identical query, or share the result of an identical query in flight
+    key = get_result_key([player_details], position, top_n, None, traits_weights, filters)
+    result = result_cache.get_or_compute(key, lambda: compute_similar_players_df_1(player_details, position, top_n, traits_weights, filters))
 
-    # get all player details
-    all_player_details = df.player_details.tolist()
+    # copies so that callers cannot modify cached results
+    similar_players_df, top_n_dict = result
 
-    # get matrix of raw traits only
-    raw_traits_df = df[RAW_TRAITS]
-    raw_traits_np = raw_traits_df.to_numpy()
+    return similar_players_df.copy(), dict(top_n_dict)
 
-    # assert that player details is in dataframe
-    assert player_details in all_player_details, 'Player details not in dataframe'
+def compute_similar_players_df_1(player_details, position, top_n=TOP_N, traits_weights=None, filters=None):
 
-    # asserts that matrix has 2 dimensions
-    assert raw_traits_np.ndim == 2, 'Matrix should have 2 dimensions'
+    # get position similarity index
+    index = similarity_indexes[position]
+    df = index.df
+    raw_traits_np = index.raw_traits_np
 
-    # asserts that matrix is not ragged
-    ragged = False
-    for i in range(1, raw_traits_np.shape[0]):
-        if len(raw_traits_np[i - 1]) != len(raw_traits_np[i]):
-            ragged = True
-            break
-    assert ragged == False, 'Ragged matrix is not allowed'
+    # get all player details
+    all_player_details = index.player_details
+
+    # assert that player details is in dataframe
+    assert player_details in index.player_details_rows, 'Player details not in dataframe'
 
     # asserts that traits weights have same length as matrix rows
     if traits_weights is not None:
@@ -288,38 +1019,39 @@ def similar_players_df_1(player_details, position, top_n=TOP_N, traits_weights=N
                                                              f'from matrix rows ({len(raw_traits_np[0])},)'
 
     # get indices of queried player names
-    player_index = all_player_details.index(player_details)
-    player_name = df.iloc[player_index]['player_name']
-    duplicate_indices = df.index[df.player_name == player_name].tolist()
+    player_index = index.player_details_rows[player_details]
+    player_name = df.player_name[player_index]
+    duplicate_indices = index.player_name_rows[player_name]
 
-    # get which indices to keep if filters are prompted
+    # get which rows to keep if filters are prompted, excluding rows of queried player names
     if filters is not None:
-        filtered_df = filter_df(df, filters)
-        keep_indices = filtered_df.index.tolist()
+        keep_mask = index.filter_index.keep_mask(filters)
+        keep_mask[duplicate_indices] = False
 
         # assert that filters does not empty dataframe
-        assert len(set(keep_indices) - set(duplicate_indices)) > 0, 'Filters result in an empty dataframe'
+        assert keep_mask.any(), 'Filters result in an empty dataframe'
     else:
-        keep_indices = []
+        keep_mask = np.ones(len(df), dtype=bool)
+        keep_mask[duplicate_indices] = False
 
-    # set indices to be deleted
-    all_indices = list(range(len(df)))
-    delete_indices = list((set(all_indices) - set(keep_indices)).union(set(duplicate_indices)))
+    # look up precomputed neighbours if enough of them are kept
+    top_n_dict = lookup_neighbours(index, player_index, keep_mask, top_n, traits_weights)
+    if top_n_dict is not None:
+        return get_similar_players_df(top_n_dict, df), top_n_dict
 
     # get queried player raw traits
-    player_raw_traits = raw_traits_np[player_index]
+    player_raw_traits = index.get_raw_traits(player_index)
 
     # get similarity scores
-    similarity_scores = get_scores(player_raw_traits, raw_traits_np, traits_weights)
-
-    if filters is not None:
-        # remove necessary rows from similarity_scores and all_player_details
-        similarity_scores = np.delete(similarity_scores, delete_indices, axis=0)
-        all_player_details = np.delete(all_player_details, delete_indices, axis=0)
+    if index.ann_index is not None:
+        similarity_scores, candidate_mask = get_ann_scores(index, player_raw_traits, traits_weights, keep_mask, top_n)
+        keep_mask = keep_mask & candidate_mask
     else:
-        # remove rows of queried player name from similarity_scores and all_player_details
-        similarity_scores = np.delete(similarity_scores, duplicate_indices, axis=0)
-        all_player_details = np.delete(all_player_details, duplicate_indices, axis=0)
+        similarity_scores = get_reweighted_scores(index, player_raw_traits, traits_weights)
+
+    # keep only necessary rows of similarity_scores and all_player_details
+    similarity_scores = similarity_scores[keep_mask]
+    all_player_details = all_player_details[keep_mask]
 
     # set top_n to the number of players if too large
     if top_n > similarity_scores.shape[0]:
@@ -340,31 +1072,28 @@ def similar_players_df_1(player_details, position, top_n=TOP_N, traits_weights=N
 
 def similar_players_df_2(player_1_details, player_2_details, position, top_n=TOP_N, player_weights=None, traits_weights=None, filters=None):
 
-    # get position df
-    df = df_full[df_full.position == position]
-    df = df.reset_index(drop=True)
+    # return cached result of an identical query, or share the result of an identical query in flight
+    key = get_result_key([player_1_details, player_2_details], position, top_n, player_weights, traits_weights, filters)
+    result = result_cache.get_or_compute(key, lambda: compute_similar_players_df_2(player_1_details, player_2_details, position, top_n, player_weights, traits_weights, filters))
 
-    # get all player details
-    all_player_details = df.player_details.tolist()
+    # copies so that callers cannot modify cached results
+    similar_players_df, top_n_dict = result
 
-    # get matrix of raw traits only
-    raw_traits_df = df[RAW_TRAITS]
-    raw_traits_np = raw_traits_df.to_numpy()
+    return similar_players_df.copy(), dict(top_n_dict)
 
-    # assert that player details are in dataframe
-    assert player_1_details in all_player_details, 'Player 1 details not in dataframe'
-    assert player_2_details in all_player_details, 'Player 2 details not in dataframe'
+def compute_similar_players_df_2(player_1_details, player_2_details, position, top_n=TOP_N, player_weights=None, traits_weights=None, filters=None):
 
-    # asserts that matrix has 2 dimensions
-    assert raw_traits_np.ndim == 2, 'Matrix should have 2 dimensions'
+    # get position similarity index
+    index = similarity_indexes[position]
+    df = index.df
+    raw_traits_np = index.raw_traits_np
 
-    # asserts that matrix is not ragged
-    ragged = False
-    for i in range(1, raw_traits_np.shape[0]):
-        if len(raw_traits_np[i - 1]) != len(raw_traits_np[i]):
-            ragged = True
-            break
-    assert ragged == False, 'Ragged matrix is not allowed'
+    # get all player details
+    all_player_details = index.player_details
+
+    # assert that player details are in dataframe
+    assert player_1_details in index.player_details_rows, 'Player 1 details not in dataframe'
+    assert player_2_details in index.player_details_rows, 'Player 2 details not in dataframe'
 
     # asserts that traits weights have same length as matrix rows
     if traits_weights is not None:
@@ -378,51 +1107,43 @@ def similar_players_df_2(player_1_details, player_2_details, position, top_n=TOP
         player_weights = [0.5, 0.5]
 
     # get indices of queried player names
-    player_1_index = all_player_details.index(player_1_details)
-    player_1_name = df.iloc[player_1_index]['player_name']
-    player_1_indices = df.index[df.player_name == player_1_name].tolist()
-    player_2_index = all_player_details.index(player_2_details)
-    player_2_name = df.iloc[player_2_index]['player_name']
-    player_2_indices = df.index[df.player_name == player_2_name].tolist()
+    player_1_index = index.player_details_rows[player_1_details]
+    player_1_name = df.player_name[player_1_index]
+    player_1_indices = index.player_name_rows[player_1_name]
+    player_2_index = index.player_details_rows[player_2_details]
+    player_2_name = df.player_name[player_2_index]
+    player_2_indices = index.player_name_rows[player_2_name]
     duplicate_indices = player_1_indices + player_2_indices
 
-    # get which indices to keep if filters are prompted
+    # get which rows to keep if filters are prompted, excluding rows of queried player names
     if filters is not None:
-        filtered_df = filter_df(df, filters)
-        keep_indices = filtered_df.index.tolist()
+        keep_mask = index.filter_index.keep_mask(filters)
+        keep_mask[duplicate_indices] = False
 
         # assert that filters does not empty dataframe
-        assert len(set(keep_indices) - set(duplicate_indices)) > 0, 'Filters result in an empty dataframe'
+        assert keep_mask.any(), 'Filters result in an empty dataframe'
     else:
-        keep_indices = []
-
-    # set indices to be deleted
-    all_indices = list(range(len(df)))
-    delete_indices = list((set(all_indices) - set(keep_indices)).union(set(duplicate_indices)))
+        keep_mask = np.ones(len(df), dtype=bool)
+        keep_mask[duplicate_indices] = False
 
     # get queried player raw traits
-    player_1_raw_traits = raw_traits_np[player_1_index]
-    player_2_raw_traits = raw_traits_np[player_2_index]
+    player_1_raw_traits = index.get_raw_traits(player_1_index)
+    player_2_raw_traits = index.get_raw_traits(player_2_index)
 
     # combined traits
     combined_raw_traits = np.average(np.array([player_1_raw_traits, player_2_raw_traits]), axis=0,
                                      weights=player_weights)
 
-    # combined player details
-    combined_player_details = f'{player_1_details} ({player_weights[0] * 100:.0f}%) + {player_2_details} ' \
-                              f'({player_weights[1] * 100:.0f}%)'
-
     # get similarity scores
-    similarity_scores = get_scores(combined_raw_traits, raw_traits_np, traits_weights)
-
-    if filters is not None:
-        # remove necessary rows from similarity_scores and all_player_details
-        similarity_scores = np.delete(similarity_scores, delete_indices, axis=0)
-        all_player_details = np.delete(all_player_details, delete_indices, axis=0)
+    if index.ann_index is not None:
+        similarity_scores, candidate_mask = get_ann_scores(index, combined_raw_traits, traits_weights, keep_mask, top_n)
+        keep_mask = keep_mask & candidate_mask
     else:
-        # remove rows of queried player name from similarity_scores and all_player_details
-        similarity_scores = np.delete(similarity_scores, duplicate_indices, axis=0)
-        all_player_details = np.delete(all_player_details, duplicate_indices, axis=0)
+        similarity_scores = get_reweighted_scores(index, combined_raw_traits, traits_weights)
+
+    # keep only necessary rows of similarity_scores and all_player_details
+    similarity_scores = similarity_scores[keep_mask]
+    all_player_details = all_player_details[keep_mask]
 
     # set top_n to the number of players if too large
     if top_n > similarity_scores.shape[0]:
@@ -441,85 +1162,125 @@ def similar_players_df_2(player_1_details, player_2_details, position, top_n=TOP
 
     return similar_players_df, top_n_dict
 
-def rating_indicators_1(query_player_details, similar_player_details, position):
-
-    # get position df
-    df = df_full[df_full.position == position]
-    df = df.reset_index(drop=True)
-
-    # get query player rating
-    query_player_rating = df[df.player_details == query_player_details].rating.tolist()[0]
-
-    # get similar player rating
-    similar_player_rating = df[df.player_details == similar_player_details].rating.tolist()[0]
-
-    # create rating indicator cards
-    fig = go.Figure()
-
-    # rating of query player
-    fig.add_trace(go.Indicator(mode='number',
-                               value=query_player_rating,
-                               title=query_player_details,
-                               domain={'row': 0, 'column': 0}))
-
-    # rating of similar player
-    fig.add_trace(go.Indicator(mode='number+delta',
-                               value=similar_player_rating,
-                               delta=dict(reference=query_player_rating),
-                               title=similar_player_details,
-                               domain={'row': 1, 'column': 0}))
+def similar_players_batch(queries, top_n=TOP_N, player_weights=None, traits_weights=None, filters=None):
 
-    # card details
-    fig.update_layout(height=800,
-                      width=1200,
-                      grid={'rows': 2, 'columns': 1},
-                      template='plotly_dark',
-                      font={'size': 18}
-    )
+    # asserts that traits weights have same length as raw traits
+    if traits_weights is not None:
+        assert len(traits_weights) == len(RAW_TRAITS), f'Weights have distinct shape ({len(traits_weights)},) ' \
+                                                       f'from matrix rows ({len(RAW_TRAITS)},)'
 
-    return fig
+    if player_weights is not None:
+        # assert that player weights sum up to 1
+        assert sum(player_weights) == 1, 'Player weights do not sum up to 1'
+    else:
+        player_weights = [0.5, 0.5]
 
-def rating_indicators_2(query_player_1_details, query_player_2_details, similar_player_details, position, player_weights=None):
+    # group queries by position, where a query is a player details or a tuple of two player details
+    position_queries = {}
+    for query_index, query in enumerate(queries):
+        query_players = [query] if isinstance(query, str) else list(query)
+        positions = {get_position(player_details) for player_details in query_players}
+        assert len(positions) == 1, f'Players in query {query} are not in the same position'
+        position_queries.setdefault(positions.pop(), []).append((query_index, query_players))
+
+    results = [None] * len(queries)
+    for position, position_query_list in position_queries.items():
+        index = similarity_indexes[position]
+        raw_traits_np = index.raw_traits_np
+
+        # get shared keep mask if filters are prompted
+        if filters is not None:
+            keep_mask = index.filter_index.keep_mask(filters)
+        else:
+            keep_mask = np.ones(len(index.df), dtype=bool)
+
+        # get raw traits of each query, combined for two players, and the rows of queried player names to exclude
+        queries_raw_traits = np.zeros([len(position_query_list), len(RAW_TRAITS)])
+        queries_keep_mask = np.tile(keep_mask, (len(position_query_list), 1))
+        for i, (_, query_players) in enumerate(position_query_list):
+            player_indices = [index.player_details_rows[player_details] for player_details in query_players]
+            if len(player_indices) == 1:
+                queries_raw_traits[i] = raw_traits_np[player_indices[0]]
+            else:
+                queries_raw_traits[i] = np.average(index.get_raw_traits(player_indices), axis=0, weights=player_weights)
+            for player_index in player_indices:
+                queries_keep_mask[i, index.player_name_rows[index.df.player_name[player_index]]] = False
+
+            # assert that filters does not empty dataframe
+            if filters is not None:
+                assert queries_keep_mask[i].any(), f'Filters result in an empty dataframe for query {queries[position_query_list[i][0]]}'
+
+        # rows with raw traits identical to each query
+        identical_rows = [index.raw_traits_rows.get(query_raw_traits.tobytes(), []) for query_raw_traits in queries_raw_traits]
+
+        # get similarity scores of all queries in one matrix product, removing rows not kept
+        similarity_scores = get_scores_matrix(queries_raw_traits, raw_traits_np, traits_weights, identical_rows)
+        similarity_scores[~queries_keep_mask] = -np.inf
+
+        # get indices of top n scores of each query
+        position_top_n = min(top_n, similarity_scores.shape[1])
+        top_n_indices = np.argpartition(similarity_scores, -position_top_n, axis=1)[:, -position_top_n:]
+        top_n_scores = np.take_along_axis(similarity_scores, top_n_indices, axis=1)
+        order = np.flip(np.argsort(top_n_scores, axis=1), axis=1)
+        top_n_indices = np.take_along_axis(top_n_indices, order, axis=1)
+
+        # dictionary of player details as keys and similarity scores as values for each query
+        for i, (query_index, _) in enumerate(position_query_list):
+            results[query_index] = {index.player_details[ind]: similarity_scores[i, ind] for ind in top_n_indices[i]
+                                    if queries_keep_mask[i, ind]}
+
+    return results
+
+def get_query_result(query_players, similar_players, position, player_weights=None):
 
     if player_weights is not None:
         # assert that player weights sum up to 1
-        assert sum(player_weights) == 1, f'Player weights do not sum up to 1'
+        assert sum(player_weights) == 1, 'Player weights do not sum up to 1'
     else:
         player_weights = [0.5, 0.5]
 
-    # get position df
-    df = df_full[df_full.position == position]
-    df = df.reset_index(drop=True)
-
-    # get query players ratings
-    query_player_1_rating = df[df.player_details == query_player_1_details].rating.tolist()[0]
-    query_player_2_rating = df[df.player_details == query_player_2_details].rating.tolist()[0]
+    # get position similarity index
+    index = similarity_indexes[position]
+
+    # get ratings and traits of query players followed by similar players, gathering all rows at once
+    rows = [index.player_details_rows[player_details] for player_details in list(query_players) + list(similar_players)]
+    ratings = index.ratings[rows].astype(float)
+    composite_traits = index.composite_traits_np[rows].astype(float)
+    raw_traits = to_decimal_float(index.df.loc[rows, RAW_TRAITS].to_numpy())
+
+    # combine query players into the first row
+    if len(query_players) == 2:
+        query_player = f'{query_players[0]} ({player_weights[0] * 100:.0f}%) + {query_players[1]} ' \
+                       f'({player_weights[1] * 100:.0f}%)'
+        ratings = np.concatenate([[np.average(ratings[:2], axis=0, weights=player_weights)], ratings[2:]])
+        composite_traits = np.vstack([np.average(composite_traits[:2], axis=0, weights=player_weights), composite_traits[2:]])
+        raw_traits = np.vstack([np.average(raw_traits[:2], axis=0, weights=player_weights), raw_traits[2:]])
+        player_weights = tuple(player_weights)
+    else:
+        query_player = query_players[0]
+        player_weights = None
 
-    # combine ratings
-    combined_player_rating = np.average(np.array([query_player_1_rating, query_player_2_rating]), axis=0,
-                                        weights=player_weights)
+    # row of each similar player
+    player_rows = {player_details: row for row, player_details in enumerate(similar_players, start=1)}
 
-    # combined player details
-    combined_player_details = f'{query_player_1_details} ({player_weights[0] * 100:.0f}%) + {query_player_2_details} ' \
-                              f'({player_weights[1] * 100:.0f}%)'
+    return QueryResult(tuple(query_players), player_weights, query_player, player_rows, ratings, composite_traits, raw_traits)
 
-    # get similar player rating
-    similar_player_rating = df[df.player_details == similar_player_details].rating.tolist()[0]
+def rating_indicators_skeleton():
 
-    # create rating indicator cards
+    # create rating indicator cards with placeholder ratings and titles
     fig = go.Figure()
 
     # rating of query player
     fig.add_trace(go.Indicator(mode='number',
-                               value=combined_player_rating,
-                               title=combined_player_details,
+                               value=0,
+                               title='',
                                domain={'row': 0, 'column': 0}))
 
     # rating of similar player
     fig.add_trace(go.Indicator(mode='number+delta',
-                               value=similar_player_rating,
-                               delta=dict(reference=combined_player_rating),
-                               title=similar_player_details,
+                               value=0,
+                               delta=dict(reference=0),
+                               title='',
                                domain={'row': 1, 'column': 0}))
 
     # card details
@@ -530,77 +1291,46 @@ def rating_indicators_2(query_player_1_details, query_player_2_details, similar_
                       font={'size': 18}
     )
 
-    return fig
+    return json.loads(fig.to_json())
 
-def composite_traits_charts_1(query_player_details, similar_player_details, position):
+def traits_charts_skeleton(traits_display):
 
-    # get position df
-    df = df_full[df_full.position == position]
-    df = df.reset_index(drop=True)
-
-    # get values for query player traits
-    composite_trait_values_1 = df[df.player_details == query_player_details][COMPOSITE_TRAITS].values[0].tolist()
-    circ_composite_trait_values_1 = composite_trait_values_1 + composite_trait_values_1[:1]
-
-    # get values for similar player traits
-    composite_trait_values_2 = df[df.player_details == similar_player_details][COMPOSITE_TRAITS].values[0].tolist()
-    circ_composite_trait_values_2 = composite_trait_values_2 + composite_trait_values_2[:1]
-
-    # get difference in traits values
-    composite_traits_diff = [composite_trait_1 - composite_trait_2 for composite_trait_1, composite_trait_2 in zip(composite_trait_values_1, composite_trait_values_2)]
-
-    # get positive and negative lists for composite traits differences
-    composite_traits_pos_diff = []
-    composite_traits_neg_diff = []
-    pos_composite_traits = []
-    neg_composite_traits = []
-    for diff, trait in zip(composite_traits_diff, COMPOSITE_TRAITS_DISPLAY):
-        if diff >= 0:
-            composite_traits_pos_diff.append(diff)
-            pos_composite_traits.append(trait)
-        else:
-            composite_traits_neg_diff.append(diff)
-            neg_composite_traits.append(trait)
-
-    # adjust composite traits lists
-    circ_composite_traits = COMPOSITE_TRAITS_DISPLAY + COMPOSITE_TRAITS_DISPLAY[:1]
-
-    # create radar charts
+    # create radar charts with placeholder traits values and player details
     fig = make_subplots(rows=1,
                         cols=2,
                         specs=[[{'type': 'polar'}, {'type': 'bar'}]],
                         subplot_titles=('Radar Chart', 'Difference Bar Chart'))
 
     # plot radar chart
-    fig.add_trace(go.Scatterpolar(r=circ_composite_trait_values_1,
-                                  theta=circ_composite_traits,
+    fig.add_trace(go.Scatterpolar(r=[],
+                                  theta=[],
                                   fill='toself',
-                                  name=query_player_details,
+                                  name='',
                                   marker=dict(color=DARK_BLUE_HEX)),
                   row=1,
                   col=1
                   )
-    fig.add_trace(go.Scatterpolar(r=circ_composite_trait_values_2,
-                                  theta=circ_composite_traits,
+    fig.add_trace(go.Scatterpolar(r=[],
+                                  theta=[],
                                   fill='toself',
-                                  name=similar_player_details,
+                                  name='',
                                   marker=dict(color=DARK_ORANGE_HEX)),
                   row=1,
                   col=1
                   )
 
     # plot difference bar chart
-    fig.add_trace(go.Bar(x=pos_composite_traits,
-                         y=composite_traits_pos_diff,
-                         name=query_player_details,
+    fig.add_trace(go.Bar(x=[],
+                         y=[],
+                         name='',
                          marker=dict(color=DARK_BLUE_HEX),
                          showlegend=False),
                   row=1,
                   col=2
                   )
-    fig.add_trace(go.Bar(x=neg_composite_traits,
-                         y=composite_traits_neg_diff,
-                         name=similar_player_details,
+    fig.add_trace(go.Bar(x=[],
+                         y=[],
+                         name='',
                          marker=dict(color=DARK_ORANGE_HEX),
                          showlegend=False),
                   row=1,
@@ -617,317 +1347,143 @@ def composite_traits_charts_1(query_player_details, similar_player_details, posi
                       template='plotly_dark',
                       font={'size': 14}
                       )
-    # fig.update_polars(radialaxis=dict(range=[0, max(circ_composite_trait_values_1)]))
-    fig.update_xaxes(categoryorder='array', categoryarray=COMPOSITE_TRAITS_DISPLAY, row=1, col=2)
+    fig.update_xaxes(categoryorder='array', categoryarray=traits_display, row=1, col=2)
     fig.update_yaxes(range=[-4, 4])
 
-    return fig
+    return json.loads(fig.to_json())
 
-def composite_traits_charts_2(query_player_1_details, query_player_2_details, similar_player_details, position, player_weights=None):
+# figures of each chart type built once, which charts clone with their own traces while sharing the layout
+figure_skeletons = {'rating_indicators': rating_indicators_skeleton(),
+                    'composite_traits_charts': traits_charts_skeleton(COMPOSITE_TRAITS_DISPLAY),
+                    'raw_traits_charts': traits_charts_skeleton(RAW_TRAITS_DISPLAY)}
 
-    if player_weights is not None:
-        # assert that player weights sum up to 1
-        assert sum(player_weights) == 1, f'Player weights do not sum up to 1'
-    else:
-        player_weights = [0.5, 0.5]
+def clone_figure(chart_type, traces):
+
+    # copy traces of skeleton updated with the given values, where layout is shared and never modified
+    skeleton = figure_skeletons[chart_type]
+
+    return {'data': [dict(trace, **values) for trace, values in zip(skeleton['data'], traces)], 'layout': skeleton['layout']}
+
+def rating_indicators(query_result, similar_player_details):
+
+    # get query and similar player ratings
+    query_player_rating = float(query_result.ratings[0])
+    similar_player_rating = float(query_result.ratings[query_result.player_rows[similar_player_details]])
+
+    # rating of query player and of similar player
+    return clone_figure('rating_indicators', [{'value': query_player_rating, 'title': {'text': query_result.query_player}},
+                                              {'value': similar_player_rating, 'delta': {'reference': query_player_rating},
+                                               'title': {'text': similar_player_details}}])
+
+def traits_charts(chart_type, query_player_details, trait_values_1, similar_player_details, trait_values_2, traits_display):
 
-    # get position df
-    df = df_full[df_full.position == position]
-    df = df.reset_index(drop=True)
-
-    # get values for query players traits
-    composite_trait_values_1 = df[df.player_details == query_player_1_details][COMPOSITE_TRAITS].values[0].tolist()
-    composite_trait_values_2 = df[df.player_details == query_player_2_details][COMPOSITE_TRAITS].values[0].tolist()
-
-    # combine traits for query players traits
-    composite_trait_values_combined = np.average(np.array([composite_trait_values_1, composite_trait_values_2]), axis=0,
-                                           weights=player_weights).tolist()
-    circ_composite_trait_values_combined = composite_trait_values_combined + composite_trait_values_combined[:1]
-
-    # get values for similar player traits
-    composite_trait_values_3 = df[df.player_details == similar_player_details][COMPOSITE_TRAITS].values[0].tolist()
-    circ_composite_trait_values_3 = composite_trait_values_3 + composite_trait_values_3[:1]
-
-    # create traits difference in traits values
-    composite_traits_diff = [composite_trait_1 - composite_trait_2 for composite_trait_1, composite_trait_2 in
-                       zip(composite_trait_values_combined, composite_trait_values_3)]
-
-    # get positive and negative lists for composite traits differences
-    composite_traits_pos_diff = []
-    composite_traits_neg_diff = []
-    pos_composite_traits = []
-    neg_composite_traits = []
-    for diff, trait in zip(composite_traits_diff, COMPOSITE_TRAITS_DISPLAY):
+    # close radar chart lines
+    circ_trait_values_1 = trait_values_1 + trait_values_1[:1]
+    circ_trait_values_2 = trait_values_2 + trait_values_2[:1]
+    circ_traits = traits_display + traits_display[:1]
+
+    # get difference in traits values
+    traits_diff = [trait_1 - trait_2 for trait_1, trait_2 in zip(trait_values_1, trait_values_2)]
+
+    # get positive and negative lists for traits differences
+    traits_pos_diff = []
+    traits_neg_diff = []
+    pos_traits = []
+    neg_traits = []
+    for diff, trait in zip(traits_diff, traits_display):
         if diff >= 0:
-            composite_traits_pos_diff.append(diff)
-            pos_composite_traits.append(trait)
+            traits_pos_diff.append(diff)
+            pos_traits.append(trait)
         else:
-            composite_traits_neg_diff.append(diff)
-            neg_composite_traits.append(trait)
+            traits_neg_diff.append(diff)
+            neg_traits.append(trait)
 
-    # adjust composite traits lists
-    circ_composite_traits = COMPOSITE_TRAITS_DISPLAY + COMPOSITE_TRAITS_DISPLAY[:1]
+    # radar chart and difference bar chart of query player and of similar player
+    return clone_figure(chart_type, [{'r': circ_trait_values_1, 'theta': circ_traits, 'name': query_player_details},
+                                     {'r': circ_trait_values_2, 'theta': circ_traits, 'name': similar_player_details},
+                                     {'x': pos_traits, 'y': traits_pos_diff, 'name': query_player_details},
+                                     {'x': neg_traits, 'y': traits_neg_diff, 'name': similar_player_details}])
 
-    # combined player details
-    combined_player_details = f'{query_player_1_details} ({player_weights[0] * 100:.0f}%) + {query_player_2_details} ' \
-                              f'({player_weights[1] * 100:.0f}%)'
+def composite_traits_charts(query_result, similar_player_details):
 
-    # create radar charts
-    fig = make_subplots(rows=1,
-                        cols=2,
-                        specs=[[{'type': 'polar'}, {'type': 'bar'}]],
-                        subplot_titles=('Radar Chart', 'Difference Bar Chart'))
+    # get values for query and similar player traits
+    composite_trait_values_1 = query_result.composite_traits[0].tolist()
+    composite_trait_values_2 = query_result.composite_traits[query_result.player_rows[similar_player_details]].tolist()
 
-    # plot radar chart
-    fig.add_trace(go.Scatterpolar(r=circ_composite_trait_values_combined,
-                                  theta=circ_composite_traits,
-                                  fill='toself',
-                                  name=combined_player_details,
-                                  marker=dict(color=DARK_BLUE_HEX)),
-                  row=1,
-                  col=1
-                  )
-    fig.add_trace(go.Scatterpolar(r=circ_composite_trait_values_3,
-                                  theta=circ_composite_traits,
-                                  fill='toself',
-                                  name=similar_player_details,
-                                  marker=dict(color=DARK_ORANGE_HEX)),
-                  row=1,
-                  col=1
-                  )
+    return traits_charts('composite_traits_charts', query_result.query_player, composite_trait_values_1,
+                         similar_player_details, composite_trait_values_2, COMPOSITE_TRAITS_DISPLAY)
 
-    # plot difference bar chart
-    fig.add_trace(go.Bar(x=pos_composite_traits,
-                         y=composite_traits_pos_diff,
-                         name=combined_player_details,
-                         marker=dict(color=DARK_BLUE_HEX),
-                         showlegend=False),
-                  row=1,
-                  col=2
-                  )
-    fig.add_trace(go.Bar(x=neg_composite_traits,
-                         y=composite_traits_neg_diff,
-                         name=similar_player_details,
-                         marker=dict(color=DARK_ORANGE_HEX),
-                         showlegend=False),
-                  row=1,
-                  col=2
-                  )
+def raw_traits_charts(query_result, similar_player_details):
 
-    # plot details
-    fig.update_layout(height=800,
-                      width=1200,
-                      margin=dict(l=90, r=90, t=90, b=10),
-                      polar={'radialaxis': {'visible': True}},
-                      showlegend=True,
-                      legend=dict(x=0, y=-0.3),
-                      template='plotly_dark',
-                      font={'size': 14}
-                      )
-    # fig.update_polars(radialaxis=dict(range=[0, max(circ_composite_trait_values_combined)]))
-    fig.update_xaxes(categoryorder='array', categoryarray=COMPOSITE_TRAITS_DISPLAY, row=1, col=2)
-    fig.update_yaxes(range=[-4, 4])
+    # get values for query and similar player traits
+    raw_trait_values_1 = query_result.raw_traits[0].tolist()
+    raw_trait_values_2 = query_result.raw_traits[query_result.player_rows[similar_player_details]].tolist()
+
+    fig = traits_charts('raw_traits_charts', query_result.query_player, raw_trait_values_1, similar_player_details,
+                        raw_trait_values_2, RAW_TRAITS_DISPLAY)
+
+    # radial axis starts at 0 for combined query players
+    if len(query_result.query_players) == 2:
+        polar = fig['layout']['polar']
+        fig['layout'] = dict(fig['layout'], polar=dict(polar, radialaxis=dict(polar['radialaxis'], range=[0, max(raw_trait_values_1)])))
 
     return fig
 
-def raw_traits_charts_1(query_player_details, similar_player_details, position):
+# chart function of each chart type
+chart_functions = {'rating_indicators': rating_indicators,
+                   'composite_traits_charts': composite_traits_charts,
+                   'raw_traits_charts': raw_traits_charts}
 
-    # get position df
-    df = df_full[df_full.position == position]
-    df = df.reset_index(drop=True)
+def query_result_chart(chart_type, query_result, similar_player_details):
 
-    # get values for query player traits
-    raw_trait_values_1 = df[df.player_details == query_player_details][RAW_TRAITS].values[0].tolist()
-    circ_raw_trait_values_1 = raw_trait_values_1 + raw_trait_values_1[:1]
+    # chart of similar player against query, cached for the chart type, query players, their weights and the similar player
+    key = (chart_type, query_result.query_players, query_result.player_weights, similar_player_details)
 
-    # get values for similar player traits
-    raw_trait_values_2 = df[df.player_details == similar_player_details][RAW_TRAITS].values[0].tolist()
-    circ_raw_trait_values_2 = raw_trait_values_2 + raw_trait_values_2[:1]
+    return figure_cache.get_or_compute(key, lambda: chart_functions[chart_type](query_result, similar_player_details))
 
-    # get difference in traits values
-    raw_traits_diff = [raw_trait_1 - raw_trait_2 for raw_trait_1, raw_trait_2 in
-                       zip(raw_trait_values_1, raw_trait_values_2)]
-
-    # get positive and negative lists for raw traits differences
-    raw_traits_pos_diff = []
-    raw_traits_neg_diff = []
-    pos_raw_traits = []
-    neg_raw_traits = []
-    for diff, trait in zip(raw_traits_diff, RAW_TRAITS_DISPLAY):
-        if diff >= 0:
-            raw_traits_pos_diff.append(diff)
-            pos_raw_traits.append(trait)
-        else:
-            raw_traits_neg_diff.append(diff)
-            neg_raw_traits.append(trait)
+def query_result_charts(query_result, similar_player_details):
 
-    # adjust raw and composite traits lists
-    circ_raw_traits = RAW_TRAITS_DISPLAY + RAW_TRAITS_DISPLAY[:1]
+    # charts of all chart types
+    return tuple(query_result_chart(chart_type, query_result, similar_player_details) for chart_type in chart_functions)
 
-    # create radar charts
-    fig = make_subplots(rows=1,
-                        cols=2,
-                        specs=[[{'type': 'polar'}, {'type': 'bar'}]],
-                        subplot_titles=('Radar Chart', 'Difference Bar Chart'))
+def rating_indicators_1(query_player_details, similar_player_details, position):
 
-    # plot radar chart
-    fig.add_trace(go.Scatterpolar(r=circ_raw_trait_values_1,
-                                  theta=circ_raw_traits,
-                                  fill='toself',
-                                  name=query_player_details,
-                                  marker=dict(color=DARK_BLUE_HEX)),
-                  row=1,
-                  col=1
-                  )
-    fig.add_trace(go.Scatterpolar(r=circ_raw_trait_values_2,
-                                  theta=circ_raw_traits,
-                                  fill='toself',
-                                  name=similar_player_details,
-                                  marker=dict(color=DARK_ORANGE_HEX)),
-                  row=1,
-                  col=1
-                  )
+    query_result = get_query_result([query_player_details], [similar_player_details], position)
 
-    # plot difference bar chart
-    fig.add_trace(go.Bar(x=pos_raw_traits,
-                         y=raw_traits_pos_diff,
-                         name=query_player_details,
-                         marker=dict(color=DARK_BLUE_HEX),
-                         showlegend=False),
-                  row=1,
-                  col=2
-                  )
-    fig.add_trace(go.Bar(x=neg_raw_traits,
-                         y=raw_traits_neg_diff,
-                         name=similar_player_details,
-                         marker=dict(color=DARK_ORANGE_HEX),
-                         showlegend=False),
-                  row=1,
-                  col=2
-                  )
+    return go.Figure(rating_indicators(query_result, similar_player_details))
 
-    # plot details
-    fig.update_layout(height=800,
-                      width=1200,
-                      margin=dict(l=90, r=90, t=90, b=10),
-                      polar={'radialaxis': {'visible': True}},
-                      showlegend=True,
-                      legend=dict(x=0, y=-0.3),
-                      template='plotly_dark',
-                      font={'size': 14}
-                      )
-    # fig.update_polars(radialaxis=dict(range=[0, max(circ_raw_trait_values_1)]))
-    fig.update_xaxes(categoryorder='array', categoryarray=RAW_TRAITS_DISPLAY, row=1, col=2)
-    fig.update_yaxes(range=[-4, 4])
+def rating_indicators_2(query_player_1_details, query_player_2_details, similar_player_details, position, player_weights=None):
 
-    return fig
+    query_result = get_query_result([query_player_1_details, query_player_2_details], [similar_player_details], position,
+                                    player_weights)
 
-def raw_traits_charts_2(query_player_1_details, query_player_2_details, similar_player_details, position, player_weights=None):
+    return go.Figure(rating_indicators(query_result, similar_player_details))
 
-    if player_weights is not None:
-        # assert that player weights sum up to 1
-        assert sum(player_weights) == 1, f'Player weights do not sum up to 1'
-    else:
-        player_weights = [0.5, 0.5]
+def composite_traits_charts_1(query_player_details, similar_player_details, position):
 
-    # get position df
-    df = df_full[df_full.position == position]
-    df = df.reset_index(drop=True)
-
-    # get values for query players traits
-    raw_trait_values_1 = df[df.player_details == query_player_1_details][RAW_TRAITS].values[0].tolist()
-    raw_trait_values_2 = df[df.player_details == query_player_2_details][RAW_TRAITS].values[0].tolist()
-
-    # combine traits for query players traits
-    raw_trait_values_combined = np.average(np.array([raw_trait_values_1, raw_trait_values_2]), axis=0,
-                                           weights=player_weights).tolist()
-    circ_raw_trait_values_combined = raw_trait_values_combined + raw_trait_values_combined[:1]
-
-    # get values for similar player traits
-    raw_trait_values_3 = df[df.player_details == similar_player_details][RAW_TRAITS].values[0].tolist()
-    circ_raw_trait_values_3 = raw_trait_values_3 + raw_trait_values_3[:1]
-
-    # create traits difference in traits values
-    raw_traits_diff = [raw_trait_1 - raw_trait_2 for raw_trait_1, raw_trait_2 in
-                       zip(raw_trait_values_combined, raw_trait_values_3)]
-
-    # get positive and negative lists for raw traits differences
-    raw_traits_pos_diff = []
-    raw_traits_neg_diff = []
-    pos_raw_traits = []
-    neg_raw_traits = []
-    for diff, trait in zip(raw_traits_diff, RAW_TRAITS_DISPLAY):
-        if diff >= 0:
-            raw_traits_pos_diff.append(diff)
-            pos_raw_traits.append(trait)
-        else:
-            raw_traits_neg_diff.append(diff)
-            neg_raw_traits.append(trait)
+    query_result = get_query_result([query_player_details], [similar_player_details], position)
 
-    # adjust raw and composite traits lists
-    circ_raw_traits = RAW_TRAITS_DISPLAY + RAW_TRAITS_DISPLAY[:1]
+    return go.Figure(composite_traits_charts(query_result, similar_player_details))
 
-    # combined player details
-    combined_player_details = f'{query_player_1_details} ({player_weights[0] * 100:.0f}%) + {query_player_2_details} ' \
-                              f'({player_weights[1] * 100:.0f}%)'
+def composite_traits_charts_2(query_player_1_details, query_player_2_details, similar_player_details, position, player_weights=None):
 
-    # create radar charts
-    fig = make_subplots(rows=1,
-                        cols=2,
-                        specs=[[{'type': 'polar'}, {'type': 'bar'}]],
-                        subplot_titles=('Radar Chart', 'Difference Bar Chart'))
+    query_result = get_query_result([query_player_1_details, query_player_2_details], [similar_player_details], position,
+                                    player_weights)
 
-    # plot radar chart
-    fig.add_trace(go.Scatterpolar(r=circ_raw_trait_values_combined,
-                                  theta=circ_raw_traits,
-                                  fill='toself',
-                                  name=combined_player_details,
-                                  marker=dict(color=DARK_BLUE_HEX)),
-                  row=1,
-                  col=1
-                  )
-    fig.add_trace(go.Scatterpolar(r=circ_raw_trait_values_3,
-                                  theta=circ_raw_traits,
-                                  fill='toself',
-                                  name=similar_player_details,
-                                  marker=dict(color=DARK_ORANGE_HEX)),
-                  row=1,
-                  col=1
-                  )
+    return go.Figure(composite_traits_charts(query_result, similar_player_details))
 
-    # plot difference bar chart
-    fig.add_trace(go.Bar(x=pos_raw_traits,
-                         y=raw_traits_pos_diff,
-                         name=combined_player_details,
-                         marker=dict(color=DARK_BLUE_HEX),
-                         showlegend=False),
-                  row=1,
-                  col=2
-                  )
-    fig.add_trace(go.Bar(x=neg_raw_traits,
-                         y=raw_traits_neg_diff,
-                         name=similar_player_details,
-                         marker=dict(color=DARK_ORANGE_HEX),
-                         showlegend=False),
-                  row=1,
-                  col=2
-                  )
+def raw_traits_charts_1(query_player_details, similar_player_details, position):
 
-    # plot details
-    fig.update_layout(height=800,
-                      width=1200,
-                      margin=dict(l=90, r=90, t=90, b=10),
-                      polar={'radialaxis': {'visible': True}},
-                      showlegend=True,
-                      legend=dict(x=0, y=-0.3),
-                      template='plotly_dark',
-                      font={'size': 14}
-                      )
-    fig.update_polars(radialaxis=dict(range=[0, max(circ_raw_trait_values_combined)]))
-    fig.update_xaxes(categoryorder='array', categoryarray=RAW_TRAITS_DISPLAY, row=1, col=2)
-    fig.update_yaxes(range=[-4, 4])
+    query_result = get_query_result([query_player_details], [similar_player_details], position)
 
-    return fig
+    return go.Figure(raw_traits_charts(query_result, similar_player_details))
+
+def raw_traits_charts_2(query_player_1_details, query_player_2_details, similar_player_details, position, player_weights=None):
+
+    query_result = get_query_result([query_player_1_details, query_player_2_details], [similar_player_details], position,
+                                    player_weights)
+
+    return go.Figure(raw_traits_charts(query_result, similar_player_details))
 
 if __name__ == '__main__':
-    print('This file should not be called directly!')
\ No newline at end of file
+    print('This file should not be called directly!')
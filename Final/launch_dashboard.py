@@ -2,13 +2,17 @@
 
 # import packages
 import pandas as pd
-from dash import Dash, dcc, html, Input, Output, State, dash_table, no_update
+from dash import Dash, dcc, html, Input, Output, State, ClientsideFunction, dash_table, no_update
+from dash.dash_table import FormatTemplate
+import argparse
+import flask
+import time
 import dash_bootstrap_components as dbc
 import helper_functions
 
 # constants
-ALL_PLAYER_DETAILS = helper_functions.get_all_player_details()
-ALL_PERIODS = ['2021', '2020-2021', '2019-2021']
+TOP_PLAYER_DETAILS = helper_functions.search_player_details('')
+ALL_PERIODS = helper_functions.get_all_periods()
 ALL_PERIODS_OPTIONS = [{'label': year, 'value': year} for year in ALL_PERIODS]
 ALL_LEAGUES = helper_functions.get_all_leagues()
 ALL_LEAGUES_OPTIONS = [{'label': league, 'value': league} for league in ALL_LEAGUES]
@@ -16,7 +20,9 @@ BACKGROUND_HEX = '#111111'
 SUBBACKGROUND_HEX = '#222222'
 SQUEEZE_TOP_BOTTOM_STYLE = {'margin-top': '-5px', 'margin-bottom': '-5px'}
 SPACE_BOTTOM_STYLE = {'margin-bottom': '5px'}
-TABLE_STYLE = {'background-color': BACKGROUND_HEX, 'margin-top': '-10px', 'textAlign': 'center', 'font-size': '16px'}
+TABLE_STYLE = {'margin-top': '-10px', 'display': 'none'}
+TABLE_CELL_STYLE = {'backgroundColor': BACKGROUND_HEX, 'color': 'white', 'textAlign': 'center', 'font-size': '16px', 'padding': '10px', 'border': '1px solid #444444'}
+TABLE_STRIPE_STYLE = [{'if': {'row_index': 'odd'}, 'backgroundColor': SUBBACKGROUND_HEX}]
 PARAGRAPH_STYLE = { 'textAlign': 'left', 'color': 'white', 'font-size': '20px'}
 SIDEBAR_STYLE = { 'position': 'fixed', 'top': 0, 'left': 0, 'bottom': 0, 'width': '30%', 'margin-top': '65px', 'textAlign': 'center', 'padding': '20px 10px', 'background-color': SUBBACKGROUND_HEX}
 CONTENT_STYLE = { 'position': 'fixed', 'top': 0, 'right': 0, 'bottom': 0, 'margin-left': '30%', 'margin-top': '65px', 'width': '70%', 'padding': '20px 10px', 'background-color': BACKGROUND_HEX}
@@ -25,7 +31,7 @@ CONTENT_STYLE = { 'position': 'fixed', 'top': 0, 'right': 0, 'bottom': 0, 'margi
 dashboard = Dash(__name__, external_stylesheets=[dbc.themes.DARKLY])
 
 # query players
-player_1_details = dcc.Dropdown(options=ALL_PLAYER_DETAILS, placeholder='Player 1', className='dropdown', id='player_1_details_dropdown')
+player_1_details = dcc.Dropdown(options=TOP_PLAYER_DETAILS, placeholder='Player 1', className='dropdown', id='player_1_details_dropdown')
 player_2_details = dcc.Dropdown(placeholder='Player 2 [Optional]', className='dropdown', id='player_2_details_dropdown')
 
 # player weights
@@ -148,7 +154,19 @@ query_inputs = dbc.Form([html.P('Query Player(s)', style=PARAGRAPH_STYLE),
 
 # components in find tab
 find_sidebar = html.Div([query_inputs], style=SIDEBAR_STYLE)
-find_table = html.Div(style=CONTENT_STYLE)
+similar_players_result = dcc.Store(storage_type='memory', id='similar_players_result_store')
+query_result_handle = dcc.Store(storage_type='memory', id='query_result_handle_store')
+built_charts = dcc.Store(storage_type='memory', id='built_charts_store')
+results_columns = [{'name': header, 'id': column} for header, column in zip(helper_functions.SIMILARITY_TABLE_HEADERS, helper_functions.SIMILARITY_RESULT_COLUMNS)]
+results_columns[-1].update(type='numeric', format=FormatTemplate.percentage(1))
+results_table = dash_table.DataTable(columns=results_columns,
+                                     style_table=TABLE_STYLE,
+                                     style_cell=TABLE_CELL_STYLE,
+                                     style_header={'fontWeight': 'bold'},
+                                     style_data_conditional=TABLE_STRIPE_STYLE,
+                                     cell_selectable=False,
+                                     id='results_table_datatable')
+find_table = html.Div([results_table], style=CONTENT_STYLE)
 
 # query player display
 query_player_table = dash_table.DataTable(data=pd.DataFrame(['']).to_dict('records'),
@@ -179,9 +197,11 @@ compare_inputs = dbc.Form([html.Br(),
 
 # components in compare tab
 compare_sidebar = html.Div([compare_inputs], style=SIDEBAR_STYLE)
-chart_tabs = dbc.Tabs([dbc.Tab([rating_indicators], label='OVERALL RATING'),
-                       dbc.Tab([composite_traits_charts], label='COMPOSITE MEASURES'),
-                       dbc.Tab([raw_traits_charts], label='DERIVED METRICS')],
+chart_tabs = dbc.Tabs([dbc.Tab([rating_indicators], label='OVERALL RATING', tab_id='rating_indicators'),
+                       dbc.Tab([composite_traits_charts], label='COMPOSITE MEASURES', tab_id='composite_traits_charts'),
+                       dbc.Tab([raw_traits_charts], label='DERIVED METRICS', tab_id='raw_traits_charts')],
+                      id='chart_tabs',
+                      active_tab='rating_indicators',
                       style={'line-height': '30px', 'margin-top': '-15px', 'margin-left': '-5px', 'margin-right': '-5px'}
                       )
 compare_charts = html.Div([chart_tabs], style=CONTENT_STYLE)
@@ -193,90 +213,76 @@ general_tabs = dbc.Tabs([dbc.Tab([find_sidebar, find_table], label='1. FIND SIMI
                         )
 
 # final layout
-dashboard.layout = html.Div([general_tabs, button_clicks], style={'background-color': BACKGROUND_HEX})
+dashboard.layout = html.Div([general_tabs, button_clicks, similar_players_result, query_result_handle, built_charts], style={'background-color': BACKGROUND_HEX})
 
 
 ### CALLBACKS
+@dashboard.callback(Output(player_1_details, component_property='options'),
+                    Input(player_1_details, component_property='search_value'),
+                    State(player_1_details, component_property='value')
+                    )
+# updates dropdown list of player 1 with top matches of typed text
+def update_player_1_options(search_value, player_1_details):
+    if not search_value:
+        return no_update
+
+    return helper_functions.get_player_options(search_value, selected_player_details=player_1_details)
+
 @dashboard.callback(Output(player_2_details, component_property='options'),
-                    Output(primary_positions_filter, component_property='options'),
+                    Input(player_2_details, component_property='search_value'),
+                    Input(player_1_details, component_property='value'),
+                    State(player_2_details, component_property='value')
+                    )
+# updates dropdown list of player 2 with top matches of typed text in the position of player 1
+def update_player_2_options(search_value, player_1_details, player_2_details):
+    if player_1_details is None:
+        return []
+
+    # keep player 2 selected only if it is in the position of player 1
+    if player_2_details == player_1_details or \
+            (player_2_details is not None and helper_functions.get_position(player_2_details) != helper_functions.get_position(player_1_details)):
+        player_2_details = None
+
+    return helper_functions.get_player_options(search_value or '', player_1_details, selected_player_details=player_2_details)
+
+@dashboard.callback(Output(primary_positions_filter, component_property='options'),
                     Input(player_1_details, component_property='value')
                     )
 # updates filters when player 1 is input
 def update_filters(player_1_details):
     if player_1_details is None:
-        position_player_details = []
         primary_positions = []
     else:
-        position_player_details = helper_functions.get_position_player_details(player_1_details)
-        position_player_details.remove(player_1_details)
         primary_positions = [{'label': position, 'value': position} for position in helper_functions.get_primary_positions(player_1_details)]
 
-    return position_player_details, primary_positions
+    return primary_positions
 
-@dashboard.callback(Output(player_2_details, component_property='value'),
-                    Input(player_1_details, component_property='value')
-                    )
 # prevents player 2 to come back when player 1 is input again
-def update_player_2(player_1_details):
-    if player_1_details is None:
-        return None
-    else:
-        return no_update
+dashboard.clientside_callback(ClientsideFunction(namespace='clientside', function_name='update_player_2'),
+                              Output(player_2_details, component_property='value'),
+                              Input(player_1_details, component_property='value')
+                              )
 
-@dashboard.callback(Output(player_1_weight, component_property='options'),
-                    Output(player_1_weight, component_property='placeholder'),
-                    Output(player_2_weight, component_property='options'),
-                    Output(player_2_weight, component_property='placeholder'),
-                    Input(player_1_details, component_property='value'),
-                    Input(player_2_details, component_property='value'))
 # updates dropdown list of weights when both players 1 and 2 are input
-def update_players_weight_dropdowns(player_1_details, player_2_details):
-    if player_1_details is None:
-        options = []
-        placeholder_1 = 'Weightage'
-        placeholder_2 = 'Weightage'
-    elif player_2_details is None:
-        options = []
-        placeholder_1 = '100%'
-        placeholder_2 = ''
-    else:
-        options = [f'{i}%' for i in range(10, 91, 10)]
-        placeholder_1 = '50%'
-        placeholder_2 = '50%'
-
-    return options, placeholder_1, options, placeholder_2
-
-@dashboard.callback(Output(player_2_weight, component_property='value'),
-                    Input(player_1_weight, component_property='value'))
-# updates player 2's weight when player 1 weight is input
-def update_player_2_weight(player_1_weight):
-
-    if player_1_weight is None:
-        return None
-
-    # convert to fraction
-    fraction_1 = int(player_1_weight[:-1]) / 100
-    fraction_2 = 1 - fraction_1
-
-    return f'{fraction_2*100:.0f}%'
-
-@dashboard.callback(Output(player_1_weight, component_property='value'),
-                    Input(player_2_weight, component_property='value'))
-# updates player 1's weight when player 2 weight is input
-def update_player_1_weight(player_2_weight):
-
-    if player_2_weight is None:
-        return None
-
-    # convert to fraction
-    fraction_2 = int(player_2_weight[:-1]) / 100
-    fraction_1 = 1 - fraction_2
-
-    return f'{fraction_1*100:.0f}%'
-
-@dashboard.callback(Output(find_table, component_property='children'),
-                    Output(query_player_table, component_property='data'),
-                    Output(similar_players_table, component_property='data'),
+dashboard.clientside_callback(ClientsideFunction(namespace='clientside', function_name='update_players_weight_dropdowns'),
+                              Output(player_1_weight, component_property='options'),
+                              Output(player_1_weight, component_property='placeholder'),
+                              Output(player_2_weight, component_property='options'),
+                              Output(player_2_weight, component_property='placeholder'),
+                              Input(player_1_details, component_property='value'),
+                              Input(player_2_details, component_property='value')
+                              )
+
+# updates weight of the other player when the weight of one player is input
+dashboard.clientside_callback(ClientsideFunction(namespace='clientside', function_name='update_players_weights'),
+                              Output(player_1_weight, component_property='value'),
+                              Output(player_2_weight, component_property='value'),
+                              Input(player_1_weight, component_property='value'),
+                              Input(player_2_weight, component_property='value')
+                              )
+
+@dashboard.callback(Output(similar_players_result, component_property='data'),
+                    Output(query_result_handle, component_property='data'),
                     Output(similar_players_table, component_property='active_cell'),
                     Output(button_clicks, component_property='data'),
                     State(player_1_details, component_property='value'),
@@ -313,7 +319,7 @@ def build_tables(player_1_details, player_2_details, player_1_weight, player_2_w
 
     # no update when no changes in input sidebar
     if submit_button <= button_clicks:
-        return no_update, no_update, no_update, no_update, no_update
+        return no_update, no_update, no_update, no_update
     else:
         position = helper_functions.get_position(player_1_details)
         traits_weights = [goals_weight, shots_weight, conversion_weight, positioning_weight, assists_weight,
@@ -337,6 +343,8 @@ def build_tables(player_1_details, player_2_details, player_1_weight, player_2_w
         # when one player is queried
         if player_2_details is None:
             query_player = player_1_details
+            query_players = [player_1_details]
+            player_weights = None
 
             similar_players_df, top_n_dict = helper_functions.similar_players_df_1(player_details=player_1_details,
                                                                                    position=position,
@@ -346,6 +354,7 @@ def build_tables(player_1_details, player_2_details, player_1_weight, player_2_w
 
         # when two players are queried
         else:
+            query_players = [player_1_details, player_2_details]
             if player_1_weight is None or player_2_weight is None:
                 player_weights = None
                 query_player = f'{player_1_details} (50%) + {player_2_details} (50%)'
@@ -361,78 +370,100 @@ def build_tables(player_1_details, player_2_details, player_1_weight, player_2_w
                                                                                    traits_weights=traits_weights,
                                                                                    filters=filters)
 
-        # get list of similar players
-        similar_players_list = list(top_n_dict.keys())
+        # compact result rendered by the client into the tables of similar players and of players to compare
+        similar_players_result = helper_functions.get_similar_players_result(similar_players_df, top_n_dict, query_player)
 
-        # create table of similar players
-        similar_players_table = dbc.Table.from_dataframe(df=similar_players_df, bordered=True, color='dark', hover=True, striped=True, style=TABLE_STYLE)
+        # ratings and traits of query and similar players kept on the server, which the charts look up by token
+        query_result = helper_functions.get_query_result(query_players, list(top_n_dict), position, player_weights)
+        query_result_handle = {'token': helper_functions.query_result_store.put(query_result),
+                               'position': position,
+                               'query_players': query_players,
+                               'player_weights': player_weights}
 
-        # create dfs for players to compare
-        query_player_df = pd.DataFrame([query_player]).to_dict('records')
-        similar_players_df = pd.DataFrame(similar_players_list).to_dict('records')
+        return similar_players_result, query_result_handle, None, submit_button
 
-        return similar_players_table, query_player_df, similar_players_df, None, submit_button
+# renders tables of similar players and of players to compare from the result
+dashboard.clientside_callback(ClientsideFunction(namespace='clientside', function_name='render_similar_players'),
+                              Output(results_table, component_property='data'),
+                              Output(results_table, component_property='style_table'),
+                              Output(query_player_table, component_property='data'),
+                              Output(similar_players_table, component_property='data'),
+                              Input(similar_players_result, component_property='data'),
+                              State(results_table, component_property='style_table')
+                              )
 
 @dashboard.callback(Output(rating_indicators, component_property='figure'),
                     Output(composite_traits_charts, component_property='figure'),
                     Output(raw_traits_charts, component_property='figure'),
-                    State(player_1_details, component_property='value'),
-                    State(player_2_details, component_property='value'),
-                    State(player_1_weight, component_property='value'),
-                    State(player_2_weight, component_property='value'),
+                    Output(built_charts, component_property='data'),
+                    State(query_result_handle, component_property='data'),
                     State(similar_players_table, component_property='data'),
-                    Input(similar_players_table, component_property='active_cell'))
-# updates charts when similar player is pressed
-def update_charts(player_1_details, player_2_details, player_1_weight, player_2_weight, similar_players_data, active_cell):
+                    State(built_charts, component_property='data'),
+                    Input(similar_players_table, component_property='active_cell'),
+                    Input(chart_tabs, component_property='active_tab'))
+# updates chart of active tab when similar player is pressed or another tab is opened
+def update_charts(query_result_handle, similar_players_data, built_charts, active_cell, active_tab):
 
     if active_cell is None:
-        return no_update, no_update, no_update
+        return no_update, no_update, no_update, no_update
     else:
         compare_player = similar_players_data[active_cell['row']]['0']
-
-        position = helper_functions.get_position(player_1_details)
-
-        # when one player is queried
-        if player_2_details is None:
-            rating_indicators = helper_functions.rating_indicators_1(query_player_details=player_1_details,
-                                                                     similar_player_details=compare_player,
-                                                                     position=position)
-
-            composite_traits_charts = helper_functions.composite_traits_charts_1(query_player_details=player_1_details,
-                                                                                 similar_player_details=compare_player,
-                                                                                 position=position)
-
-            raw_traits_charts = helper_functions.raw_traits_charts_1(query_player_details=player_1_details,
-                                                                     similar_player_details=compare_player,
-                                                                     position=position)
-        # when two players are queried
+        selection = [query_result_handle['token'], compare_player]
+
+        # keep charts already built for the selected similar player, and blank charts of the previous one
+        if built_charts is not None and built_charts['selection'] == selection:
+            if active_tab in built_charts['tabs']:
+                return no_update, no_update, no_update, no_update
+            tabs = built_charts['tabs'] + [active_tab]
+            figures = [no_update, no_update, no_update]
         else:
-            if player_1_weight is None or player_2_weight is None:
-                player_weights = None
-            else:
-                player_weights = [int(player_1_weight[:-1]) / 100, int(player_2_weight[:-1]) / 100]
-
-            rating_indicators = helper_functions.rating_indicators_2(query_player_1_details=player_1_details,
-                                                                     query_player_2_details=player_2_details,
-                                                                     similar_player_details=compare_player,
-                                                                     position=position,
-                                                                     player_weights=player_weights)
-
-            composite_traits_charts = helper_functions.composite_traits_charts_2(query_player_1_details=player_1_details,
-                                                                                 query_player_2_details=player_2_details,
-                                                                                 similar_player_details=compare_player,
-                                                                                 position=position,
-                                                                                 player_weights=player_weights)
+            tabs = [active_tab]
+            figures = [helper_functions.placeholder_figure() for _ in helper_functions.chart_functions]
+
+        # rebuild query result if its token was evicted or issued by another worker
+        query_result = helper_functions.query_result_store.get(query_result_handle['token'])
+        if query_result is None:
+            query_result = helper_functions.get_query_result(query_result_handle['query_players'],
+                                                             [row['0'] for row in similar_players_data],
+                                                             query_result_handle['position'],
+                                                             query_result_handle['player_weights'])
+            helper_functions.query_result_store.put(query_result, query_result_handle['token'])
+
+        # build chart of active tab only
+        figures[list(helper_functions.chart_functions).index(active_tab)] = \
+            helper_functions.query_result_chart(active_tab, query_result, compare_player)
+
+        return *figures, {'selection': selection, 'tabs': tabs}
+
+def audit_callbacks():
+
+    # list server callbacks, as clientside callbacks have no python function and make no requests
+    print('Server callbacks:')
+    for output, callback in dashboard.callback_map.items():
+        if 'callback' in callback:
+            print(f'  {output} <- {len(callback["inputs"])} inputs, {len(callback["state"])} states')
+
+    @dashboard.server.before_request
+    def start_timer():
+        flask.g.start = time.perf_counter()
+
+    # log sizes of the payload and response of each server callback request
+    @dashboard.server.after_request
+    def log_callback(response):
+        if flask.request.path.endswith('_dash-update-component'):
+            payload = flask.request.get_json(silent=True) or {}
+            print(f'{payload.get("output")}: payload {flask.request.content_length} bytes, '
+                  f'response {response.calculate_content_length()} bytes, {(time.perf_counter() - flask.g.start) * 1000:.0f}ms')
+        return response
 
-            raw_traits_charts = helper_functions.raw_traits_charts_2(query_player_1_details=player_1_details,
-                                                                     query_player_2_details=player_2_details,
-                                                                     similar_player_details=compare_player,
-                                                                     position=position,
-                                                                     player_weights=player_weights)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--audit', action='store_true', help='list server callbacks and log the size of each request')
+    args = parser.parse_args()
 
-        return rating_indicators, composite_traits_charts, raw_traits_charts
+    if args.audit:
+        audit_callbacks()
 
-if __name__ == '__main__':
     # dashboard.run_server(port=8888, debug=True)
     dashboard.run_server(port=8888, debug=False)
 
@@ -0,0 +1,118 @@
+# Run with `python load_test.py --workers 1 2 4` to measure requests per second of the similar players callback of the
+# dashboard served by `serve_dashboard.py` with each number of worker processes.
+
+# import packages
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import urllib.request
+import urllib.error
+import subprocess
+import argparse
+import json
+import sys
+import time
+import launch_dashboard
+
+# constants
+HOST = '127.0.0.1'
+PORT = 8899
+WORKERS = [1, 2, 4]
+THREADS = 2
+NUM_REQUESTS = 400
+CONCURRENCY = 16
+STARTUP_TIMEOUT = 120
+SEED = 0
+
+def get_callback_payloads(num_requests, seed=SEED):
+
+    rng = np.random.default_rng(seed)
+
+    # callback of the submit button, which builds the table of similar players
+    output = next(output for output in launch_dashboard.dashboard.callback_map if 'button_clicks_store.data' in output)
+    callback = launch_dashboard.dashboard.callback_map[output]
+    outputs = [{'id': output_id, 'property': output_property}
+               for output_id, output_property in (output.rsplit('.', 1) for output in output.strip('.').split('...'))]
+
+    # random query players and traits weights so that most requests miss the result cache
+    payloads = []
+    for player_details in rng.choice(launch_dashboard.helper_functions.get_all_player_details(), size=num_requests):
+        values = {'player_1_details_dropdown': player_details,
+                  'age_range_filter_slider': [launch_dashboard.helper_functions.MIN_AGE, launch_dashboard.helper_functions.MAX_AGE],
+                  'min_total_mins_filter_input': launch_dashboard.helper_functions.MIN_TOTAL_MINS,
+                  'min_rating_filter_input': launch_dashboard.helper_functions.MIN_RATING,
+                  'button_clicks_store': 0}
+        state = []
+        for item in callback['state']:
+            if item['id'].endswith('_weight_slider'):
+                value = int(rng.choice([1, 3, 5, 7, 9]))
+            else:
+                value = values.get(item['id'])
+            state.append({'id': item['id'], 'property': item['property'], 'value': value})
+        inputs = [{'id': item['id'], 'property': item['property'], 'value': 1} for item in callback['inputs']]
+
+        payloads.append(json.dumps({'output': output, 'outputs': outputs, 'inputs': inputs, 'state': state,
+                                    'changedPropIds': [f'{item["id"]}.{item["property"]}' for item in callback['inputs']]}).encode())
+
+    return payloads
+
+def post(url, payload):
+
+    request = urllib.request.Request(url, data=payload, headers={'Content-Type': 'application/json'})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request) as response:
+        assert response.status == 200, f'Request failed with status {response.status}'
+        response.read()
+
+    return time.perf_counter() - start
+
+def wait_for_server(url, process, timeout=STARTUP_TIMEOUT):
+
+    # poll the layout until the server responds
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        assert process.poll() is None, 'Server exited before responding'
+        try:
+            with urllib.request.urlopen(url + '_dash-layout'):
+                return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.5)
+
+    raise TimeoutError(f'Server did not respond within {timeout}s')
+
+def load_test(workers, threads=THREADS, num_requests=NUM_REQUESTS, concurrency=CONCURRENCY, host=HOST, port=PORT):
+
+    url = f'http://{host}:{port}/'
+    payloads = get_callback_payloads(concurrency + num_requests)
+    warm_up_payloads, payloads = payloads[:concurrency], payloads[concurrency:]
+
+    process = subprocess.Popen([sys.executable, 'serve_dashboard.py', '--host', host, '--port', str(port),
+                                '--workers', str(workers), '--threads', str(threads)],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_server(url, process)
+
+        # warm up workers with other queries before timing
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(lambda payload: post(url + '_dash-update-component', payload), warm_up_payloads))
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(lambda payload: post(url + '_dash-update-component', payload), payloads))
+        elapsed = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+
+    print(f'{workers} workers x {threads} threads: {num_requests / elapsed:.1f} requests/s, '
+          f'p50 {np.percentile(latencies, 50) * 1000:.0f}ms, p95 {np.percentile(latencies, 95) * 1000:.0f}ms')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=WORKERS, help='numbers of worker processes to test')
+    parser.add_argument('--threads', type=int, default=THREADS, help='number of threads of each worker process')
+    parser.add_argument('--requests', type=int, default=NUM_REQUESTS, help='number of requests for each number of workers')
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY, help='number of concurrent requests')
+    args = parser.parse_args()
+
+    for workers in args.workers:
+        load_test(workers, args.threads, args.requests, args.concurrency)
@@ -2,7 +2,16 @@
 
 # import packages
 import pandas as pd
+import numpy as np
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from datetime import date
+from columnar_data import save_columnar_chunks
 
 # paths for csv files for each position
 CB_DATA_PATH = 'Data/data_cb.csv'
@@ -11,349 +20,390 @@ DM_DATA_PATH = 'Data/data_dm.csv'
 M_DATA_PATH = 'Data/data_m.csv'
 W_DATA_PATH = 'Data/data_w.csv'
 CF_DATA_PATH = 'Data/data_cf.csv'
+POSITION_DATA_PATHS = {'CB': CB_DATA_PATH, 'FB': FB_DATA_PATH, 'DM': DM_DATA_PATH,
+                       'M': M_DATA_PATH, 'W': W_DATA_PATH, 'CF': CF_DATA_PATH}
 
-def preprocess():
+# paths for preprocessed csv file and columnar dataframe
+DF_FULL_PATH = 'Data/df_full.csv'
+DF_FULL_COLUMNAR_PATH = 'Data/df_full'
 
-    # load dataframes for each position
-    cb_df = pd.read_csv(CB_DATA_PATH)
-    fb_df = pd.read_csv(FB_DATA_PATH)
-    dm_df = pd.read_csv(DM_DATA_PATH)
-    m_df = pd.read_csv(M_DATA_PATH)
-    w_df = pd.read_csv(W_DATA_PATH)
-    cf_df = pd.read_csv(CF_DATA_PATH)
+# path for manifest of input csv files used by the last preprocessing
+MANIFEST_PATH = 'Data/preprocess_manifest.json'
+
+# constants
+# number of rows read at a time from csv files that are not streamed in chunks of a given size
+READ_CHUNKSIZE = 1 << 16
+# multi-season periods ending at the latest season, with `weights` from oldest to latest season or a `decay` applied
+# to older seasons; set `rolling` to also compute the period ending at every earlier season
+PERIOD_SPECS = [{'window': 2, 'weights': [1, 2]},
+                {'window': 3, 'weights': [1, 2, 3]}]
+UNIQUE_IDS = ['player_name', 'position', 'primary_position', 'nationality', 'dob', 'age']
+SUM_COLUMNS = ['apps', 'mins', 'total_mins']
+TRAIT_COLUMNS = ['scoring', 'creating', 'passing', 'defending',
+                 'goals', 'shots', 'conversion', 'positioning', 'assists', 'crossing', 'dribbling', 'carries',
+                 'involvement', 'accuracy', 'intent', 'receiving', 'aerial', 'on_ball', 'off_ball', 'fouls']
+MEAN_COLUMNS = ['rating'] + TRAIT_COLUMNS
+CATEGORICAL_COLUMNS = ['league', 'team', 'position', 'primary_position', 'nationality']
+FIRST_ROW_COLUMNS = UNIQUE_IDS + ['season', 'team_id', 'league']
+OUTPUT_COLUMNS = ['player_details', 'player_name', 'season', 'league', 'team', 'position', 'primary_position',
+                  'nationality', 'dob', 'age'] + SUM_COLUMNS + MEAN_COLUMNS
+STRING_COLUMNS = ['player_details', 'player_name', 'season'] + CATEGORICAL_COLUMNS
+
+def load_position_df(path, position):
+
+    # load dataframe for position
+    return clean_position_df(pd.read_csv(path), position)
+
+def clean_position_df(df, position):
 
     # drop ord column
-    cb_df = cb_df.drop(columns='Ord')
-    fb_df = fb_df.drop(columns='Ord')
-    dm_df = dm_df.drop(columns='Ord')
-    m_df = m_df.drop(columns='Ord')
-    w_df = w_df.drop(columns='Ord')
-    cf_df = cf_df.drop(columns='Ord')
+    df = df.drop(columns='Ord')
 
     # replace spaces with underscores and lowercase column names
-    cb_df.columns = [col.replace(' ', '_').lower() for col in cb_df.columns]
-    fb_df.columns = [col.replace(' ', '_').lower() for col in fb_df.columns]
-    dm_df.columns = [col.replace(' ', '_').lower() for col in dm_df.columns]
-    m_df.columns = [col.replace(' ', '_').lower() for col in m_df.columns]
-    w_df.columns = [col.replace(' ', '_').lower() for col in w_df.columns]
-    cf_df.columns = [col.replace(' ', '_').lower() for col in cf_df.columns]
+    df.columns = [col.replace(' ', '_').lower() for col in df.columns]
 
     # rename `player_name` column to `player_details`
-    cb_df = cb_df.rename(columns={'player_name': 'player_details'})
-    fb_df = fb_df.rename(columns={'player_name': 'player_details'})
-    dm_df = dm_df.rename(columns={'player_name': 'player_details'})
-    m_df = m_df.rename(columns={'player_name': 'player_details'})
-    w_df = w_df.rename(columns={'player_name': 'player_details'})
-    cf_df = cf_df.rename(columns={'player_name': 'player_details'})
+    df = df.rename(columns={'player_name': 'player_details'})
 
     # add a column `player_name`
-    cb_player_names = [row.player_details.replace(row.team_id, '').replace(str(row.season), '').strip() for index, row in cb_df.iterrows()]
-    cb_df.insert(1, 'player_name', cb_player_names)
-    fb_player_names = [row.player_details.replace(row.team_id, '').replace(str(row.season), '').strip() for index, row in fb_df.iterrows()]
-    fb_df.insert(1, 'player_name', fb_player_names)
-    dm_player_names = [row.player_details.replace(row.team_id, '').replace(str(row.season), '').strip() for index, row in dm_df.iterrows()]
-    dm_df.insert(1, 'player_name', dm_player_names)
-    m_player_names = [row.player_details.replace(row.team_id, '').replace(str(row.season), '').strip() for index, row in m_df.iterrows()]
-    m_df.insert(1, 'player_name', m_player_names)
-    w_player_names = [row.player_details.replace(row.team_id, '').replace(str(row.season), '').strip() for index, row in w_df.iterrows()]
-    w_df.insert(1, 'player_name', w_player_names)
-    cf_player_names = [row.player_details.replace(row.team_id, '').replace(str(row.season), '').strip() for index, row in cf_df.iterrows()]
-    cf_df.insert(1, 'player_name', cf_player_names)
+    player_names = [player_details.replace(team_id, '').replace(season, '').strip()
+                    for player_details, team_id, season in zip(df.player_details, df.team_id, df.season.map(str))]
+    df.insert(1, 'player_name', player_names)
 
     # add a column 'total_mins'
-    cb_df.insert(10, 'total_mins', cb_df.apps * cb_df.mins)
-    fb_df.insert(10, 'total_mins', fb_df.apps * fb_df.mins)
-    dm_df.insert(10, 'total_mins', dm_df.apps * dm_df.mins)
-    m_df.insert(10, 'total_mins', m_df.apps * m_df.mins)
-    w_df.insert(10, 'total_mins', w_df.apps * w_df.mins)
-    cf_df.insert(10, 'total_mins', cf_df.apps * cf_df.mins)
+    df.insert(10, 'total_mins', df.apps * df.mins)
 
     # add a column 'age'
-    cb_df.insert(8, 'age', date.today().year - cb_df.dob)
-    fb_df.insert(8, 'age', date.today().year - fb_df.dob)
-    dm_df.insert(8, 'age', date.today().year - dm_df.dob)
-    m_df.insert(8, 'age', date.today().year - m_df.dob)
-    w_df.insert(8, 'age', date.today().year - w_df.dob)
-    cf_df.insert(8, 'age', date.today().year - cf_df.dob)
+    df.insert(8, 'age', date.today().year - df.dob)
 
     # add a column 'position'
-    cb_df.insert(5, 'position', 'CB')
-    fb_df.insert(5, 'position', 'FB')
-    dm_df.insert(5, 'position', 'DM')
-    m_df.insert(5, 'position', 'M')
-    w_df.insert(5, 'position', 'W')
-    cf_df.insert(5, 'position', 'CF')
+    df.insert(5, 'position', position)
 
     # convert season from int to str
-    cb_df.season = cb_df.season.map(str)
-    fb_df.season = fb_df.season.map(str)
-    dm_df.season = dm_df.season.map(str)
-    m_df.season = m_df.season.map(str)
-    w_df.season = w_df.season.map(str)
-    cf_df.season = cf_df.season.map(str)
-
-    # create a full dataframe for all positions
-    all_dfs = [cb_df, fb_df, dm_df, m_df, w_df, cf_df]
-    all_df = pd.concat(all_dfs)
-
-    #  combine statistics for players with 2 rows for one season into 1 row and
-    # combine statistics into periods 2021, 2020-2021, 2019-2021 with weights on recent seasons
-    SEASONS = ['2019', '2020', '2021']
-    agg_full_df = pd.DataFrame({'player_details': [], 'player_name': [], 'season': [], 'league': [], 'team': [], 'position': [], 'primary_position': [],
-                                'nationality': [], 'dob': [], 'age': [], 'apps': [], 'mins': [], 'total_mins': [],
-                                'rating': [], 'scoring': [], 'creating': [], 'passing': [], 'defending': [],
-                                'goals': [], 'shots': [], 'conversion': [], 'positioning': [],
-                                'assists': [], 'crossing': [], 'dribbling': [], 'carries': [],
-                                'involvement': [], 'accuracy': [], 'intent': [], 'receiving': [],
-                                'aerial': [], 'on_ball': [], 'off_ball': [], 'fouls': []})
-    unique_ids = ['player_name', 'position', 'primary_position', 'nationality', 'dob', 'age']
-    uniques = []
-
-    for index, row in all_df[unique_ids].iterrows():
-        # iterate through unique players
-        if row[unique_ids].tolist() not in uniques:
-            uniques.append(row[unique_ids].tolist())
-
-            player_name = row.player_name
-            position = row.position
-            primary_position = row.primary_position
-            nationality = row.nationality
-            dob = row.dob
-            age = row.age
-
-            player_df = all_df[(all_df.player_name == player_name) &
-                               (all_df.position == position) &
-                               (all_df.primary_position == primary_position) &
-                               (all_df.nationality == nationality) &
-                               (all_df.dob == dob) &
-                               (all_df.age == age)]
-
-            # dict with all aggregated values for 2019, 2020, 2021, 2020-2021, 2019-2021, if present
-            seasons_combined_dict = {'player_details': [], 'player_name': [], 'season': [], 'league': [], 'team': [], 'position': [], 'primary_position': [],
-                                     'nationality': [], 'dob': [], 'age': [], 'apps': [], 'mins': [], 'total_mins': [],
-                                     'rating': [], 'scoring': [], 'creating': [], 'passing': [], 'defending': [],
-                                     'goals': [], 'shots': [], 'conversion': [], 'positioning': [],
-                                     'assists': [], 'crossing': [], 'dribbling': [], 'carries': [],
-                                     'involvement': [], 'accuracy': [], 'intent': [], 'receiving': [],
-                                     'aerial': [], 'on_ball': [], 'off_ball': [], 'fouls': []}
-
-            # indexed to 2019, 2020, 2021
-            has_seasons = [False, False, False]
-            for index, season in enumerate(SEASONS):
-                season_df = player_df[player_df.season == season]
-                if len(season_df) > 0:
-                    has_seasons[index] = True
+    df.season = df.season.map(str)
+
+    return df
+
+def read_seasons(paths, chunksize=READ_CHUNKSIZE):
+
+    # single seasons present in the raw csv files, reading only the season column in chunks
+    seasons = set()
+    for path in paths:
+        for chunk in pd.read_csv(path, usecols=['Season'], chunksize=chunksize):
+            seasons.update(chunk.Season.map(str))
+
+    return sorted(seasons)
+
+def partial_aggregates(df, first_row=0):
+
+    # number rows in order of the csv file, starting from the first row of the chunk
+    df = df.assign(row_order=np.arange(first_row, first_row + len(df)))
+
+    # identity values in the same dtypes for every chunk, since read_csv infers dtypes per chunk and integer and float
+    # dob or age of the same player hash differently, dropping rows with missing identity values
+    df = df.astype({'dob': float, 'age': float})
+    df = df[df[UNIQUE_IDS].notna().all(axis=1)]
+
+    # sort rows by player season, keeping original order within each player season
+    groups = df.groupby(UNIQUE_IDS + ['season'], sort=False).ngroup().to_numpy()
+    order = np.argsort(groups, kind='stable')
+    df = df.iloc[order]
+    starts = np.flatnonzero(np.diff(groups[order], prepend=-1))
+
+    # first row of each player season, with sums of appearances, minutes and traits and number of rows
+    partial_df = df[FIRST_ROW_COLUMNS + ['row_order'] + SUM_COLUMNS + MEAN_COLUMNS].iloc[starts].reset_index(drop=True)
+    partial_df[SUM_COLUMNS] = np.add.reduceat(df[SUM_COLUMNS].to_numpy(dtype=float), starts, axis=0)
+    partial_df[MEAN_COLUMNS] = np.add.reduceat(df[MEAN_COLUMNS].to_numpy(dtype=float), starts, axis=0)
+    partial_df['count'] = np.diff(np.r_[starts, len(df)])
+
+    return partial_df
+
+def aggregate_seasons(partial_df, seasons):
+
+    # number unique players by the row of their first appearance
+    partial_df = partial_df.assign(player_id=partial_df.groupby(UNIQUE_IDS, sort=False).row_order.transform('min'))
+    partial_df = partial_df[partial_df.season.isin(seasons)]
+
+    # sort partial aggregates by player and season, keeping order of first rows within each season
+    partial_df = partial_df.sort_values(by=['player_id', 'season', 'row_order'], kind='stable')
+    player_seasons = partial_df[['player_id', 'season']].to_numpy()
+    starts = np.flatnonzero(np.r_[True, (player_seasons[1:] != player_seasons[:-1]).any(axis=1)])
+    counts = np.add.reduceat(partial_df['count'].to_numpy(), starts)
+
+    # first row of each player season for identity, team and league
+    season_df = partial_df.iloc[starts].reset_index(drop=True)
+    season_df = season_df.rename(columns={'team_id': 'team'})
+    season_df['player_details'] = season_df.player_name + ' ' + season_df.team + ' ' + season_df.season
+
+    # sum of appearances and minutes, mean of traits for players with 2 rows for one season, which may be aggregated in
+    # different chunks
+    season_df[SUM_COLUMNS] = np.add.reduceat(partial_df[SUM_COLUMNS].to_numpy(), starts, axis=0)
+    season_df[MEAN_COLUMNS] = np.add.reduceat(partial_df[MEAN_COLUMNS].to_numpy(), starts, axis=0) / counts[:, None]
+
+    return season_df[['player_id'] + OUTPUT_COLUMNS]
+
+def blend_seasons(season_df, seasons, weights, period):
+
+    # rows of each season for players present in all seasons of the period
+    season_dfs = [season_df[season_df.season == season].set_index('player_id') for season in seasons]
+    player_ids = season_dfs[0].index
+    for df in season_dfs[1:]:
+        player_ids = player_ids.intersection(df.index, sort=False)
+    season_dfs = [df.loc[player_ids] for df in season_dfs]
+
+    # identity, team and league of the latest season
+    period_df = season_dfs[-1].copy()
+    period_df['season'] = period
+    period_df['player_details'] = period_df.player_name + ' ' + period_df.team + ' ' + period
+
+    # average appearances and minutes over seasons
+    sums = 0
+    for df in season_dfs:
+        sums = sums + df[SUM_COLUMNS].to_numpy()
+    period_df[SUM_COLUMNS] = sums / len(seasons)
+
+    # weighted average of traits with larger weights on recent seasons
+    weighted_sums = 0
+    for df, weight in reversed(list(zip(season_dfs, weights))):
+        weighted_sums = weighted_sums + weight * df[MEAN_COLUMNS].to_numpy()
+    period_df[MEAN_COLUMNS] = weighted_sums / sum(weights)
+
+    return period_df.reset_index()
+
+def get_periods(seasons, period_specs=PERIOD_SPECS):
+
+    periods = []
+    for period_spec in period_specs:
+        window = period_spec['window']
+
+        # weights from oldest to latest season
+        if 'weights' in period_spec:
+            weights = period_spec['weights']
+            assert len(weights) == window, f'Weights have distinct length ({len(weights)}) from window ({window})'
+        else:
+            weights = [period_spec['decay'] ** (window - 1 - i) for i in range(window)]
+
+        # index of the latest season of each period, skipping periods longer than the seasons in the input
+        if period_spec.get('rolling', False):
+            ends = range(window - 1, len(seasons))
+        else:
+            ends = [len(seasons) - 1] if len(seasons) >= window else []
+
+        # skip periods already given by an earlier spec
+        for end in ends:
+            period_seasons = seasons[end - window + 1:end + 1]
+            period = f'{period_seasons[0]}-{period_seasons[-1]}'
+            if period not in [existing_period for existing_period, _, _ in periods]:
+                periods.append((period, period_seasons, weights))
+
+    return periods
+
+def combine_seasons(partial_df, seasons, keep_player_id=False):
+
+    # combine statistics for players with 2 rows for one season into 1 row
+    season_df = aggregate_seasons(partial_df, seasons)
+
+    # combine statistics into periods with weights on recent seasons
+    periods = get_periods(seasons)
+    period_dfs = [blend_seasons(season_df, period_seasons, weights, period) for period, period_seasons, weights in periods]
+
+    # order rows by player, then by season and period
+    agg_df = pd.concat([season_df] + period_dfs, ignore_index=True)
+    period_order = {period: order for order, period in enumerate(seasons + [period for period, _, _ in periods])}
+    agg_df['period_order'] = agg_df.season.map(period_order)
+    agg_df = agg_df.sort_values(by=['player_id', 'period_order'], kind='stable')
+
+    if keep_player_id:
+        return agg_df[['player_id'] + OUTPUT_COLUMNS].reset_index(drop=True)
+
+    return agg_df[OUTPUT_COLUMNS].reset_index(drop=True)
+
+def spill_df(df, path):
+
+    # append dataframe to a spill file
+    with open(path, 'ab') as f:
+        pickle.dump(df, f)
+
+def load_spilled_df(path):
+
+    # all dataframes appended to a spill file
+    dfs = []
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                dfs.append(pickle.load(f))
+            except EOFError:
+                break
+
+    return pd.concat(dfs)
+
+def stream_position_df(path, position, seasons, chunksize, output_path):
+
+    # number of spill partitions so that each holds about one chunk of rows
+    with open(path, 'rb') as f:
+        num_rows = sum(1 for _ in f) - 1
+    num_partitions = max(1, -(-num_rows // chunksize))
+
+    # number of consecutive player ids in each output bucket, so that each holds at most about one chunk of rows as every
+    # player has at most one row for each season and period
+    bucket_size = max(1, chunksize // (len(seasons) + len(get_periods(seasons))))
+    num_buckets = max(1, -(-num_rows // bucket_size))
+
+    with tempfile.TemporaryDirectory() as spill_dir:
+        partition_paths = [os.path.join(spill_dir, f'partition_{i}.pkl') for i in range(num_partitions)]
+        bucket_paths = [os.path.join(spill_dir, f'bucket_{i}.pkl') for i in range(num_buckets)]
+
+        # clean raw rows chunk by chunk and spill partial aggregates of each player season to partitions by player, so
+        # each player is in one partition
+        num_rows = 0
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            partial_df = partial_aggregates(clean_position_df(chunk, position), num_rows)
+            num_rows += len(chunk)
+            player_ids = partial_df[UNIQUE_IDS].astype({column: str for column in UNIQUE_IDS if column not in ('dob', 'age')})
+            partitions = pd.util.hash_pandas_object(player_ids, index=False).to_numpy() % num_partitions
+            for partition, partition_df in partial_df.groupby(partitions):
+                spill_df(partition_df, partition_paths[partition])
+
+        # aggregate and blend each partition on its own, then spill its rows to buckets of consecutive player ids
+        for partition_path in partition_paths:
+            if os.path.exists(partition_path):
+                agg_df = combine_seasons(load_spilled_df(partition_path), seasons, keep_player_id=True)
+                for bucket, bucket_df in agg_df.groupby(agg_df.player_id.to_numpy() // bucket_size):
+                    spill_df(bucket_df, bucket_paths[bucket])
+
+        # write buckets in order, ordering players by their first appearance, where rows of each player are in order
+        with open(output_path, 'w', newline='') as f:
+            pd.DataFrame(columns=OUTPUT_COLUMNS).to_csv(f, index=False)
+            for bucket_path in bucket_paths:
+                if os.path.exists(bucket_path):
+                    bucket_df = load_spilled_df(bucket_path).sort_values(by='player_id', kind='stable')
+                    bucket_df[OUTPUT_COLUMNS].to_csv(f, header=False, index=False)
+
+    return num_rows
+
+def preprocess_position(position, path, output_path, chunksize=None, seasons=None):
+
+    # seasons of this position only if not given for all positions
+    if seasons is None:
+        seasons = read_seasons([path])
+
+    # stream rows in chunks to bound memory
+    if chunksize is not None:
+        return stream_position_df(path, position, seasons, chunksize, output_path)
+
+    # load, clean, aggregate and blend rows of one position
+    position_df = load_position_df(path, position)
+    combine_seasons(partial_aggregates(position_df), seasons).to_csv(output_path, index=False)
+
+    return len(position_df)
+
+def read_output_chunks(path, chunksize, index_col=None):
+
+    # rows of a preprocessed csv file in chunks, with string columns read as strings and floats read back exactly
+    return pd.read_csv(path, index_col=index_col, chunksize=chunksize, dtype={column: str for column in STRING_COLUMNS},
+                       float_precision='round_trip', keep_default_na=False, na_values=[''])
+
+def file_hash(path):
+
+    # sha256 of file contents, read in chunks
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(chunk)
+
+    return sha256.hexdigest()
+
+def get_config(seasons):
+
+    # settings that change every row of the output when they change
+    return {'seasons': seasons, 'period_specs': PERIOD_SPECS, 'age_year': date.today().year}
+
+def load_manifest():
+
+    try:
+        with open(MANIFEST_PATH) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def save_manifest(manifest):
+
+    with open(MANIFEST_PATH, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+def preprocess(full=False, jobs=1, chunksize=None):
+
+    # hash input csv files for each position
+    inputs = {position: {'path': path, 'sha256': file_hash(path)} for position, path in POSITION_DATA_PATHS.items()}
+
+    # seasons of all positions, so that every position has the same periods
+    seasons = read_seasons(POSITION_DATA_PATHS.values(), chunksize or READ_CHUNKSIZE)
+
+    # reuse rows of unchanged positions if the manifest matches the current settings and output
+    manifest = load_manifest()
+    reuse = (not full and manifest is not None and manifest['config'] == get_config(seasons) and
+             os.path.exists(DF_FULL_PATH) and manifest['output_sha256'] == file_hash(DF_FULL_PATH))
+    if reuse:
+        changed_positions = [position for position in POSITION_DATA_PATHS
+                             if manifest['inputs'].get(position, {}).get('sha256') != inputs[position]['sha256']]
+    else:
+        changed_positions = list(POSITION_DATA_PATHS)
+
+    # rows read at a time from output csv files
+    read_chunksize = chunksize or READ_CHUNKSIZE
+
+    with tempfile.TemporaryDirectory() as output_dir:
+
+        # preprocess changed positions into csv files, on a pool of worker processes if more than one job
+        changed_paths = [POSITION_DATA_PATHS[position] for position in changed_positions]
+        output_paths = [os.path.join(output_dir, f'{position}.csv') for position in changed_positions]
+        chunksizes = [chunksize] * len(changed_positions)
+        changed_seasons = [seasons] * len(changed_positions)
+        if jobs > 1 and len(changed_positions) > 1:
+            with ProcessPoolExecutor(max_workers=min(jobs, len(changed_positions))) as executor:
+                results = dict(zip(changed_positions, executor.map(preprocess_position, changed_positions, changed_paths, output_paths, chunksizes, changed_seasons)))
+        else:
+            results = dict(zip(changed_positions, map(preprocess_position, changed_positions, changed_paths, output_paths, chunksizes, changed_seasons)))
+
+        # positions are independent since player identity includes position, so the full dataframe is the positions in
+        # order, written chunk by chunk so that it is never held in memory
+        num_output_rows = 0
+        with open(DF_FULL_PATH + '.tmp', 'w', newline='') as f:
+            pd.DataFrame(columns=OUTPUT_COLUMNS).to_csv(f)
+            for position in POSITION_DATA_PATHS:
+                if position in results:
+                    inputs[position]['rows'] = results[position]
+                    print(f'Preprocessed {position} ({inputs[position]["rows"]} rows)')
+                    position_dfs = read_output_chunks(os.path.join(output_dir, f'{position}.csv'), read_chunksize)
                 else:
-                    continue
-
-                # compute aggregated values
-                team_id = season_df.team_id.tolist()[0]
-                player_details = player_name + ' ' + team_id + ' ' + season
-                league = season_df.league.tolist()[0]
-                apps = sum(season_df.apps.tolist())
-                mins = sum(season_df.mins.tolist())
-                total_mins = sum(season_df.total_mins.tolist())
-                rating = sum(season_df.rating.tolist()) / len(season_df.rating.tolist())
-                scoring = sum(season_df.scoring.tolist()) / len(season_df.scoring.tolist())
-                creating = sum(season_df.creating.tolist()) / len(season_df.creating.tolist())
-                passing = sum(season_df.passing.tolist()) / len(season_df.passing.tolist())
-                defending = sum(season_df.defending.tolist()) / len(season_df.defending.tolist())
-                goals = sum(season_df.goals.tolist()) / len(season_df.goals.tolist())
-                shots = sum(season_df.shots.tolist()) / len(season_df.shots.tolist())
-                conversion = sum(season_df.conversion.tolist()) / len(season_df.conversion.tolist())
-                positioning = sum(season_df.positioning.tolist()) / len(season_df.positioning.tolist())
-                assists = sum(season_df.assists.tolist()) / len(season_df.assists.tolist())
-                crossing = sum(season_df.crossing.tolist()) / len(season_df.crossing.tolist())
-                dribbling = sum(season_df.dribbling.tolist()) / len(season_df.dribbling.tolist())
-                carries = sum(season_df.carries.tolist()) / len(season_df.carries.tolist())
-                involvement = sum(season_df.involvement.tolist()) / len(season_df.involvement.tolist())
-                accuracy = sum(season_df.accuracy.tolist()) / len(season_df.accuracy.tolist())
-                intent = sum(season_df.intent.tolist()) / len(season_df.intent.tolist())
-                receiving = sum(season_df.receiving.tolist()) / len(season_df.receiving.tolist())
-                aerial = sum(season_df.aerial.tolist()) / len(season_df.aerial.tolist())
-                on_ball = sum(season_df.on_ball.tolist()) / len(season_df.on_ball.tolist())
-                off_ball = sum(season_df.off_ball.tolist()) / len(season_df.off_ball.tolist())
-                fouls = sum(season_df.fouls.tolist()) / len(season_df.fouls.tolist())
-
-                # add aggregated values to dictionary
-                seasons_combined_dict['player_details'].append(player_details)
-                seasons_combined_dict['player_name'].append(player_name)
-                seasons_combined_dict['season'].append(season)
-                seasons_combined_dict['league'].append(league)
-                seasons_combined_dict['team'].append(team_id)
-                seasons_combined_dict['position'].append(position)
-                seasons_combined_dict['primary_position'].append(primary_position)
-                seasons_combined_dict['nationality'].append(nationality)
-                seasons_combined_dict['dob'].append(dob)
-                seasons_combined_dict['age'].append(age)
-                seasons_combined_dict['apps'].append(apps)
-                seasons_combined_dict['mins'].append(mins)
-                seasons_combined_dict['total_mins'].append(total_mins)
-                seasons_combined_dict['rating'].append(rating)
-                seasons_combined_dict['scoring'].append(scoring)
-                seasons_combined_dict['creating'].append(creating)
-                seasons_combined_dict['passing'].append(passing)
-                seasons_combined_dict['defending'].append(defending)
-                seasons_combined_dict['goals'].append(goals)
-                seasons_combined_dict['shots'].append(shots)
-                seasons_combined_dict['conversion'].append(conversion)
-                seasons_combined_dict['positioning'].append(positioning)
-                seasons_combined_dict['assists'].append(assists)
-                seasons_combined_dict['crossing'].append(crossing)
-                seasons_combined_dict['dribbling'].append(dribbling)
-                seasons_combined_dict['carries'].append(carries)
-                seasons_combined_dict['involvement'].append(involvement)
-                seasons_combined_dict['accuracy'].append(accuracy)
-                seasons_combined_dict['intent'].append(intent)
-                seasons_combined_dict['receiving'].append(receiving)
-                seasons_combined_dict['aerial'].append(aerial)
-                seasons_combined_dict['on_ball'].append(on_ball)
-                seasons_combined_dict['off_ball'].append(off_ball)
-                seasons_combined_dict['fouls'].append(fouls)
-
-            # for 2020-2021
-            if all(has_seasons[1:]):
-                season = '2020-2021'
-                player_details = player_name + ' ' + seasons_combined_dict['team'][-1] + ' ' + season
-                league = seasons_combined_dict['league'][-1]
-                team_id = seasons_combined_dict['team'][-1]
-                apps = sum(seasons_combined_dict['apps'][-2:]) / 2
-                mins = sum(seasons_combined_dict['mins'][-2:]) / 2
-                total_mins = sum(seasons_combined_dict['total_mins'][-2:]) / 2
-                # weighted 2 for 2021 and 1 for 2020 for traits
-                rating = (2 * seasons_combined_dict['rating'][-1] + seasons_combined_dict['rating'][-2]) / 3
-                scoring = (2 * seasons_combined_dict['scoring'][-1] + seasons_combined_dict['scoring'][-2]) / 3
-                creating = (2 * seasons_combined_dict['creating'][-1] + seasons_combined_dict['creating'][-2]) / 3
-                passing = (2 * seasons_combined_dict['passing'][-1] + seasons_combined_dict['passing'][-2]) / 3
-                defending = (2 * seasons_combined_dict['defending'][-1] + seasons_combined_dict['defending'][-2]) / 3
-                goals = (2 * seasons_combined_dict['goals'][-1] + seasons_combined_dict['goals'][-2]) / 3
-                shots = (2 * seasons_combined_dict['shots'][-1] + seasons_combined_dict['shots'][-2]) / 3
-                conversion = (2 * seasons_combined_dict['conversion'][-1] + seasons_combined_dict['conversion'][-2]) / 3
-                positioning = (2 * seasons_combined_dict['positioning'][-1] + seasons_combined_dict['positioning'][-2]) / 3
-                assists = (2 * seasons_combined_dict['assists'][-1] + seasons_combined_dict['assists'][-2]) / 3
-                crossing = (2 * seasons_combined_dict['crossing'][-1] + seasons_combined_dict['crossing'][-2]) / 3
-                dribbling = (2 * seasons_combined_dict['dribbling'][-1] + seasons_combined_dict['dribbling'][-2]) / 3
-                carries = (2 * seasons_combined_dict['carries'][-1] + seasons_combined_dict['carries'][-2]) / 3
-                involvement = (2 * seasons_combined_dict['involvement'][-1] + seasons_combined_dict['involvement'][-2]) / 3
-                accuracy = (2 * seasons_combined_dict['accuracy'][-1] + seasons_combined_dict['accuracy'][-2]) / 3
-                intent = (2 * seasons_combined_dict['intent'][-1] + seasons_combined_dict['intent'][-2]) / 3
-                receiving = (2 * seasons_combined_dict['receiving'][-1] + seasons_combined_dict['receiving'][-2]) / 3
-                aerial = (2 * seasons_combined_dict['aerial'][-1] + seasons_combined_dict['aerial'][-2]) / 3
-                on_ball = (2 * seasons_combined_dict['on_ball'][-1] + seasons_combined_dict['on_ball'][-2]) / 3
-                off_ball = (2 * seasons_combined_dict['off_ball'][-1] + seasons_combined_dict['off_ball'][-2]) / 3
-                fouls = (2 * seasons_combined_dict['fouls'][-1] + seasons_combined_dict['fouls'][-2]) / 3
-
-                # add aggregated values to dictionary
-                seasons_combined_dict['player_details'].append(player_details)
-                seasons_combined_dict['player_name'].append(player_name)
-                seasons_combined_dict['season'].append(season)
-                seasons_combined_dict['league'].append(league)
-                seasons_combined_dict['team'].append(team_id)
-                seasons_combined_dict['position'].append(position)
-                seasons_combined_dict['primary_position'].append(primary_position)
-                seasons_combined_dict['nationality'].append(nationality)
-                seasons_combined_dict['dob'].append(dob)
-                seasons_combined_dict['age'].append(age)
-                seasons_combined_dict['apps'].append(apps)
-                seasons_combined_dict['mins'].append(mins)
-                seasons_combined_dict['total_mins'].append(total_mins)
-                seasons_combined_dict['rating'].append(rating)
-                seasons_combined_dict['scoring'].append(scoring)
-                seasons_combined_dict['creating'].append(creating)
-                seasons_combined_dict['passing'].append(passing)
-                seasons_combined_dict['defending'].append(defending)
-                seasons_combined_dict['goals'].append(goals)
-                seasons_combined_dict['shots'].append(shots)
-                seasons_combined_dict['conversion'].append(conversion)
-                seasons_combined_dict['positioning'].append(positioning)
-                seasons_combined_dict['assists'].append(assists)
-                seasons_combined_dict['crossing'].append(crossing)
-                seasons_combined_dict['dribbling'].append(dribbling)
-                seasons_combined_dict['carries'].append(carries)
-                seasons_combined_dict['involvement'].append(involvement)
-                seasons_combined_dict['accuracy'].append(accuracy)
-                seasons_combined_dict['intent'].append(intent)
-                seasons_combined_dict['receiving'].append(receiving)
-                seasons_combined_dict['aerial'].append(aerial)
-                seasons_combined_dict['on_ball'].append(on_ball)
-                seasons_combined_dict['off_ball'].append(off_ball)
-                seasons_combined_dict['fouls'].append(fouls)
-
-            # for 2019-2021
-            if all(has_seasons):
-                season = '2019-2021'
-                player_details = player_name + ' ' + seasons_combined_dict['team'][-1] + ' ' + season
-                league = seasons_combined_dict['league'][-1]
-                team_id = seasons_combined_dict['team'][-1]
-                apps = sum(seasons_combined_dict['apps'][:3]) / 3
-                mins = sum(seasons_combined_dict['mins'][:3]) / 3
-                total_mins = sum(seasons_combined_dict['total_mins'][:3]) / 3
-                # weighted 3 for 2021, 2 for 2020 and 1 for 2019 for traits
-                rating = (3 * seasons_combined_dict['rating'][2] + 2 * seasons_combined_dict['rating'][1] + seasons_combined_dict['rating'][0]) / 6
-                scoring = (3 * seasons_combined_dict['scoring'][2] + 2 * seasons_combined_dict['scoring'][1] + seasons_combined_dict['scoring'][0]) / 6
-                creating = (3 * seasons_combined_dict['creating'][2] + 2 * seasons_combined_dict['creating'][1] + seasons_combined_dict['creating'][0]) / 6
-                passing = (3 * seasons_combined_dict['passing'][2] + 2 * seasons_combined_dict['passing'][1] + seasons_combined_dict['passing'][0]) / 6
-                defending = (3 * seasons_combined_dict['defending'][2] + 2 * seasons_combined_dict['defending'][1] + seasons_combined_dict['defending'][0]) / 6
-                goals = (3 * seasons_combined_dict['goals'][2] + 2 * seasons_combined_dict['goals'][1] + seasons_combined_dict['goals'][0]) / 6
-                shots = (3 * seasons_combined_dict['shots'][2] + 2 * seasons_combined_dict['shots'][1] + seasons_combined_dict['shots'][0]) / 6
-                conversion = (3 * seasons_combined_dict['conversion'][2] + 2 * seasons_combined_dict['conversion'][1] + seasons_combined_dict['conversion'][0]) / 6
-                positioning = (3 * seasons_combined_dict['positioning'][2] + 2 * seasons_combined_dict['positioning'][1] + seasons_combined_dict['positioning'][0]) / 6
-                assists = (3 * seasons_combined_dict['assists'][2] + 2 * seasons_combined_dict['assists'][1] + seasons_combined_dict['assists'][0]) / 6
-                crossing = (3 * seasons_combined_dict['crossing'][2] + 2 * seasons_combined_dict['crossing'][1] + seasons_combined_dict['crossing'][0]) / 6
-                dribbling = (3 * seasons_combined_dict['dribbling'][2] + 2 * seasons_combined_dict['dribbling'][1] + seasons_combined_dict['dribbling'][0]) / 6
-                carries = (3 * seasons_combined_dict['carries'][2] + 2 * seasons_combined_dict['carries'][1] + seasons_combined_dict['carries'][0]) / 6
-                involvement = (3 * seasons_combined_dict['involvement'][2] + 2 * seasons_combined_dict['involvement'][ 1] + seasons_combined_dict['involvement'][0]) / 6
-                accuracy = (3 * seasons_combined_dict['accuracy'][2] + 2 * seasons_combined_dict['accuracy'][1] + seasons_combined_dict['accuracy'][0]) / 6
-                intent = (3 * seasons_combined_dict['intent'][2] + 2 * seasons_combined_dict['intent'][1] + seasons_combined_dict['intent'][0]) / 6
-                receiving = (3 * seasons_combined_dict['receiving'][2] + 2 * seasons_combined_dict['receiving'][1] + seasons_combined_dict['receiving'][0]) / 6
-                aerial = (3 * seasons_combined_dict['aerial'][2] + 2 * seasons_combined_dict['aerial'][1] + seasons_combined_dict['aerial'][0]) / 6
-                on_ball = (3 * seasons_combined_dict['on_ball'][2] + 2 * seasons_combined_dict['on_ball'][1] + seasons_combined_dict['on_ball'][0]) / 6
-                off_ball = (3 * seasons_combined_dict['off_ball'][2] + 2 * seasons_combined_dict['off_ball'][1] + seasons_combined_dict['off_ball'][0]) / 6
-                fouls = (3 * seasons_combined_dict['fouls'][2] + 2 * seasons_combined_dict['fouls'][1] + seasons_combined_dict['fouls'][0]) / 6
-
-                # add aggregated values to dictionary
-                seasons_combined_dict['player_details'].append(player_details)
-                seasons_combined_dict['player_name'].append(player_name)
-                seasons_combined_dict['season'].append(season)
-                seasons_combined_dict['league'].append(league)
-                seasons_combined_dict['team'].append(team_id)
-                seasons_combined_dict['position'].append(position)
-                seasons_combined_dict['primary_position'].append(primary_position)
-                seasons_combined_dict['nationality'].append(nationality)
-                seasons_combined_dict['dob'].append(dob)
-                seasons_combined_dict['age'].append(age)
-                seasons_combined_dict['apps'].append(apps)
-                seasons_combined_dict['mins'].append(mins)
-                seasons_combined_dict['total_mins'].append(total_mins)
-                seasons_combined_dict['rating'].append(rating)
-                seasons_combined_dict['scoring'].append(scoring)
-                seasons_combined_dict['creating'].append(creating)
-                seasons_combined_dict['passing'].append(passing)
-                seasons_combined_dict['defending'].append(defending)
-                seasons_combined_dict['goals'].append(goals)
-                seasons_combined_dict['shots'].append(shots)
-                seasons_combined_dict['conversion'].append(conversion)
-                seasons_combined_dict['positioning'].append(positioning)
-                seasons_combined_dict['assists'].append(assists)
-                seasons_combined_dict['crossing'].append(crossing)
-                seasons_combined_dict['dribbling'].append(dribbling)
-                seasons_combined_dict['carries'].append(carries)
-                seasons_combined_dict['involvement'].append(involvement)
-                seasons_combined_dict['accuracy'].append(accuracy)
-                seasons_combined_dict['intent'].append(intent)
-                seasons_combined_dict['receiving'].append(receiving)
-                seasons_combined_dict['aerial'].append(aerial)
-                seasons_combined_dict['on_ball'].append(on_ball)
-                seasons_combined_dict['off_ball'].append(off_ball)
-                seasons_combined_dict['fouls'].append(fouls)
-
-            # add to new_df
-            seasons_combined_df = pd.DataFrame(seasons_combined_dict)
-            agg_full_df = pd.concat([agg_full_df, seasons_combined_df], ignore_index=True)
-
-    # save dataframes as csv files
-    agg_full_df.to_csv('Data/df_full.csv')
+                    inputs[position]['rows'] = manifest['inputs'][position]['rows']
+                    position_dfs = (df[df.position == position] for df in read_output_chunks(DF_FULL_PATH, read_chunksize, index_col=0))
+                for position_df in position_dfs:
+                    position_df.index = pd.RangeIndex(num_output_rows, num_output_rows + len(position_df))
+                    position_df.to_csv(f, header=False)
+                    num_output_rows += len(position_df)
+        os.replace(DF_FULL_PATH + '.tmp', DF_FULL_PATH)
+
+    save_df_full_columnar(read_chunksize)
+    save_manifest({'config': get_config(seasons), 'inputs': inputs, 'output_sha256': file_hash(DF_FULL_PATH)})
+
+def save_df_full_columnar(chunksize=READ_CHUNKSIZE):
+
+    # save csv file in columnar format with categorical metadata and float32 traits, reading it in chunks
+    save_columnar_chunks(lambda: read_output_chunks(DF_FULL_PATH, chunksize, index_col=0), DF_FULL_COLUMNAR_PATH,
+                         categorical_columns=CATEGORICAL_COLUMNS, float32_columns=TRAIT_COLUMNS)
 
 if __name__ == '__main__':
-    preprocess()
-    print('Data preprocessed!')
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--full', action='store_true', help='reprocess all positions even if their csv files are unchanged')
+    parser.add_argument('--jobs', type=int, default=1, help='number of worker processes to preprocess positions in parallel')
+    parser.add_argument('--chunksize', type=int, help='stream csv files in chunks of this many rows to bound memory')
+    parser.add_argument('--columnar-only', action='store_true', help='only convert the existing df_full.csv to the columnar format')
+    args = parser.parse_args()
+
+    if args.columnar_only:
+        save_df_full_columnar()
+        print('Data converted!')
+    else:
+        preprocess(full=args.full, jobs=args.jobs, chunksize=args.chunksize)
+        print('Data preprocessed!')
@@ -0,0 +1,9 @@
+# Run with `python publish_shared_arrays.py` after preprocessing to publish the arrays of the similarity indexes into
+# memory-mapped files, which every worker of the dashboard attaches to instead of building its own copy.
+
+# import packages
+import helper_functions
+
+if __name__ == '__main__':
+    helper_functions.publish_shared_arrays()
+    print('Shared arrays published!')
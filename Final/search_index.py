@@ -0,0 +1,66 @@
+# Script containing a prefix index of player details for 'helper_functions.py', which finds the player details whose
+# words start with each typed word, so that dropdowns only receive the top matches.
+
+# import packages
+import numpy as np
+import unicodedata
+import re
+
+# constants
+SEARCH_LIMIT = 20
+
+def tokenise(text):
+
+    # lowercase words without accents, so that 'mbappe' matches 'Mbappé'
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(character for character in text if not unicodedata.combining(character))
+
+    return re.findall(r'\w+', text)
+
+class PlayerSearchIndex:
+
+    def __init__(self, player_details, positions):
+
+        # player details in order of priority, where earlier rows are returned first
+        self.player_details = np.asarray(player_details, dtype=object)
+        positions = np.asarray(positions, dtype=object)
+        self.position_masks = {position: positions == position for position in set(positions)}
+
+        # sorted words of all player details and the row of each word
+        words = []
+        rows = []
+        for row, details in enumerate(player_details):
+            for word in set(tokenise(details)):
+                words.append(word)
+                rows.append(row)
+        order = np.argsort(words, kind='stable')
+        self.words = np.asarray(words, dtype=str)[order]
+        self.word_rows = np.asarray(rows, dtype=np.int64)[order]
+
+    def prefix_rows(self, prefix):
+
+        # rows with any word starting with prefix, found by binary search in the sorted words
+        start = np.searchsorted(self.words, prefix, side='left')
+        end = np.searchsorted(self.words, prefix + '\U0010ffff', side='left')
+
+        return self.word_rows[start:end]
+
+    def search(self, text, position=None, exclude=None, limit=SEARCH_LIMIT):
+
+        # rows matching every typed word, or all rows if nothing is typed
+        mask = np.ones(len(self.player_details), dtype=bool)
+        for prefix in tokenise(text):
+            prefix_mask = np.zeros(len(self.player_details), dtype=bool)
+            prefix_mask[self.prefix_rows(prefix)] = True
+            mask &= prefix_mask
+
+        # keep rows of position only and remove excluded player details
+        if position is not None:
+            mask &= self.position_masks.get(position, False)
+        if exclude is not None:
+            mask &= self.player_details != exclude
+
+        return self.player_details[np.flatnonzero(mask)[:limit]].tolist()
+
+if __name__ == '__main__':
+    print('This file should not be called directly!')
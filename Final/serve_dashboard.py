@@ -0,0 +1,57 @@
+# Run with `python serve_dashboard.py --workers 4 --threads 2` to serve the dashboard with gunicorn on
+# http://127.0.0.1:8888/, or point any pre-forking WSGI server at `serve_dashboard:server` with the app preloaded.
+
+# import packages
+from gunicorn.app.base import BaseApplication
+import argparse
+import gc
+import os
+import launch_dashboard
+
+# constants
+HOST = '127.0.0.1'
+PORT = 8888
+WORKERS = os.cpu_count()
+THREADS = 2
+TIMEOUT = 60
+
+# wsgi application, imported with the dataset and indexes before workers are forked so that they share its pages
+server = launch_dashboard.dashboard.server
+
+# move objects loaded so far out of garbage collection so that collections in workers do not copy their pages
+gc.freeze()
+
+class DashboardApplication(BaseApplication):
+
+    def __init__(self, options):
+
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+
+        for name, value in self.options.items():
+            self.cfg.set(name, value)
+
+    def load(self):
+
+        return server
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default=HOST, help='host to bind to')
+    parser.add_argument('--port', type=int, default=PORT, help='port to bind to')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='number of worker processes')
+    parser.add_argument('--threads', type=int, default=THREADS, help='number of threads of each worker process')
+    parser.add_argument('--timeout', type=int, default=TIMEOUT, help='seconds before a silent worker is restarted')
+    parser.add_argument('--audit', action='store_true', help='list server callbacks and log the size of each request')
+    args = parser.parse_args()
+
+    if args.audit:
+        launch_dashboard.audit_callbacks()
+
+    DashboardApplication({'bind': f'{args.host}:{args.port}',
+                          'workers': args.workers,
+                          'threads': args.threads,
+                          'timeout': args.timeout,
+                          'preload_app': True}).run()